@@ -0,0 +1,174 @@
+import json
+import random
+import threading
+import time
+import requests
+from bench.synthetic import contract_count, make_contracts, make_entity
+from src.OpenSanctionsv2 import DEFAULT_KEYWORDS
+
+class MockResponse:
+    """The parts of requests.Response the pipeline uses."""
+
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+        self.text = json.dumps(data)[:200] if data is not None else ''
+
+    def json(self):
+        return self._data
+
+class MockAPI:
+    """Base for the local API stand-ins: call counting, latency and injected errors.
+
+    Every call sleeps `latency` seconds (plus up to `jitter`), and fails with a
+    connection error or an HTTP 500 at the given rates.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, connection_error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.connection_error_rate = connection_error_rate
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+    def _begin(self):
+        """Count the call, wait out the simulated latency and return an error response if one is due."""
+        with self._lock:
+            self.calls += 1
+            roll = self._rng.random()
+            delay = self.latency + self._rng.random() * self.jitter
+        if delay:
+            time.sleep(delay)
+        if roll < self.connection_error_rate:
+            with self._lock:
+                self.errors += 1
+            raise requests.exceptions.ConnectionError('Simulated connection error')
+        if roll < self.connection_error_rate + self.error_rate:
+            with self._lock:
+                self.errors += 1
+            return MockResponse(500, {'detail': 'Simulated server error'})
+        return None
+
+    def stats(self):
+        return {'requests': self.calls, 'errors': self.errors}
+
+class MockOpenSanctions(MockAPI):
+    """Stand-in for `search/sanctions`: `entities` synthetic entities dealt round-robin over the keywords."""
+
+    def __init__(self, entities, keywords=DEFAULT_KEYWORDS, seed=0, **options):
+        super().__init__(seed=seed, **options)
+        self.entities = entities
+        self.keywords = list(keywords)
+        self.seed = seed
+
+    def total(self, keyword):
+        if keyword not in self.keywords:
+            return 0
+        position = self.keywords.index(keyword)
+        return max(0, -(-(self.entities - position) // len(self.keywords)))
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        error = self._begin()
+        if error is not None:
+            return error
+        keyword = params['q']
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 10))
+        total = self.total(keyword)
+        position = self.keywords.index(keyword) if keyword in self.keywords else 0
+        results = [make_entity(position + i * len(self.keywords), self.keywords, self.seed)
+                   for i in range(offset, min(offset + limit, total))]
+        return MockResponse(200, {'results': results, 'total': {'value': total, 'relation': 'eq'},
+                                  'limit': limit, 'offset': offset})
+
+    def post(self, url, params=None, json=None, headers=None, **kwargs):
+        """Stand-in for `/match`: about one supplier in twenty matches a sanctioned entity."""
+        error = self._begin()
+        if error is not None:
+            return error
+        responses = {}
+        for key, query in (json or {}).get('queries', {}).items():
+            properties = query.get('properties', {})
+            identity = (properties.get('innCode') or properties.get('name') or [''])[0]
+            roll = random.Random(f'{self.seed}:{identity}').random()
+            results = []
+            if roll < 0.2:
+                score = 0.95 if roll < 0.05 else 0.5
+                results.append({'id': f'NK-{identity}', 'caption': (properties.get('name') or [identity])[0],
+                                'score': score, 'match': score >= float((params or {}).get('threshold', 0.7)),
+                                'topics': ['sanction'], 'datasets': ['mock_sanctions']})
+            responses[key] = {'status': 200, 'results': results, 'total': {'value': len(results), 'relation': 'eq'}}
+        return MockResponse(200, {'responses': responses})
+
+class MockClearSpending(MockAPI):
+    """Stand-in for `filtered-contracts` that answers 429 when a key is used faster than `key_interval`."""
+
+    def __init__(self, key_interval=0.0, retry_after=1, mean_contracts=40, **options):
+        super().__init__(**options)
+        self.key_interval = key_interval
+        self.retry_after = retry_after
+        self.mean_contracts = mean_contracts
+        self.rate_limited = 0
+        self._last_call = {}
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        error = self._begin()
+        if error is not None:
+            return error
+        key = params.get('apikey')
+        now = time.monotonic()
+        with self._lock:
+            if self.key_interval and now - self._last_call.get(key, float('-inf')) < self.key_interval:
+                self.rate_limited += 1
+                return MockResponse(429, {'detail': 'Too many requests'}, {'Retry-After': str(self.retry_after)})
+            self._last_call[key] = now
+
+        inn = params.get('customer_inn')
+        count = contract_count(inn, self.mean_contracts)
+        page_size = int(params.get('page_size', 50))
+        start = (int(params.get('page', 1)) - 1) * page_size
+        data = make_contracts(inn, start, min(start + page_size, count))
+        return MockResponse(200, {'count': count, 'data': data})
+
+    def stats(self):
+        return dict(super().stats(), rate_limited=self.rate_limited)
+
+class MockSession:
+    """Session stand-in that routes each request to the mock API serving that URL."""
+
+    def __init__(self, opensanctions=None, clearspending=None):
+        self.routes = {'opensanctions.org': opensanctions, 'clearspending.ru': clearspending}
+
+    def _route(self, url):
+        for host, api in self.routes.items():
+            if host in url and api is not None:
+                return api
+        raise requests.exceptions.ConnectionError(f'No mock API for {url}')
+
+    def get(self, url, **kwargs):
+        return self._route(url).get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self._route(url).post(url, **kwargs)
+
+    def stats(self):
+        return {host: api.stats() for host, api in self.routes.items() if api is not None}
+
+class MockTranslateClient(MockAPI):
+    """Stand-in for the Google Translate v2 client, enforcing its 128-segment batch limit."""
+
+    max_segments = 128
+
+    def translate(self, values, target_language='ru', **kwargs):
+        single = isinstance(values, str)
+        texts = [values] if single else list(values)
+        if len(texts) > self.max_segments:
+            raise ValueError(f'Too many text segments: {len(texts)} > {self.max_segments}')
+        if self._begin() is not None:
+            raise RuntimeError('Simulated translate error')
+        results = [{'input': text, 'translatedText': f'{text} ({target_language})'} for text in texts]
+        return results[0] if single else results
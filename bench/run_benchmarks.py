@@ -0,0 +1,270 @@
+"""Offline throughput benchmarks for the pipeline stages.
+
+Every `run_*` stage of main.py runs against local API stand-ins and synthetic
+data, one after another in a scratch directory, and the timings are written
+as JSON so runs on different commits can be compared:
+
+    python -m bench.run_benchmarks --scale 10000 --output before.json
+    python -m bench.run_benchmarks --scale 10000 --compare before.json
+"""
+import argparse
+import contextlib
+import datetime
+from functools import partial
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import pandas as pd
+from bench.mocks import MockClearSpending, MockOpenSanctions, MockSession, MockTranslateClient
+from bench.synthetic import write_bulk_file
+from src.OpenSanctionsv2 import DEFAULT_KEYWORDS, run_opensanctions
+from src.bulkingest import run_bulk_opensanctions
+from src.cleaningscriptv2 import run_cleaning
+from src.clearspendingv5 import run_clearspending
+from src.datamerge import run_merge
+from src.final_clean import run_final_clean
+from src.keyscheduler import KeyScheduler
+from src.pipeline import run_streaming_pipeline
+from src.screening import run_screening
+from src.sharding import run_sharded_clearspending
+from src.store import read_sections, read_store
+from src.translate import run_translation
+
+STAGES = ['opensanctions', 'bulk', 'clean', 'suppliers', 'sharded', 'screen', 'merge', 'dedup', 'translate', 'streaming']
+
+def count_rows(path):
+    """Number of entity rows in a stage output (plain CSV, sectioned CSV or Arrow store)."""
+    if not os.path.exists(path):
+        return 0
+    if path.endswith('.arrow'):
+        return len(read_store(path, columns=['role']))
+    with open(path, 'r', encoding='utf-8') as f:
+        if f.readline().startswith('**'):
+            return len(read_sections(path))
+    return len(pd.read_csv(path, usecols=[0]))
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def api_options(args):
+    return {'latency': args.latency, 'jitter': args.jitter, 'error_rate': args.error_rate}
+
+def make_spending_api(args):
+    return MockClearSpending(key_interval=args.key_interval, retry_after=args.retry_after, **api_options(args))
+
+def spending_session(key_interval, retry_after, options):
+    """A session with its own ClearSpending stand-in; built inside each shard process."""
+    return MockSession(clearspending=MockClearSpending(key_interval=key_interval, retry_after=retry_after, **options))
+
+def bench_keys(args):
+    return [f'bench-key-{i}' for i in range(args.keys)]
+
+def scheduler_options(args):
+    return {'rate': args.key_rate, 'burst': args.key_burst, 'max_rate': max(args.key_rate, 2.0),
+            'base_backoff': args.backoff}
+
+def make_scheduler(args):
+    return KeyScheduler(bench_keys(args), **scheduler_options(args))
+
+def run_benchmarks(args, workdir):
+    """Run the selected stages in pipeline order and return their results."""
+    def path(name):
+        return os.path.join(workdir, name)
+
+    search_output = path('sanctioned_entities_with_inn.csv')
+    bulk_file = path('bulk.json.gz')
+    bulk_output = path('sanctioned_entities_bulk.csv')
+    cleaned = path('data_cleaned_finalv2.csv')
+    spending = path('top_3_suppliers_by_companyv2.csv')
+    screened = path('suppliers_screened.csv')
+    merged = path('merged.arrow')
+    final = path('forImportGenius_no_duplicates.csv')
+    translated = path('data_request.csv')
+
+    def opensanctions():
+        api = MockOpenSanctions(args.scale, **api_options(args))
+        run_opensanctions('bench-key', search_output, session=MockSession(opensanctions=api))
+        return args.scale, search_output, api.stats()
+
+    def bulk():
+        write_bulk_file(bulk_file, args.scale)
+        run_bulk_opensanctions(bulk_file, bulk_output, DEFAULT_KEYWORDS)
+        return args.scale, bulk_output, {}
+
+    def clean():
+        run_cleaning(search_output, cleaned, chunksize=args.chunksize)
+        return count_rows(search_output), cleaned, {}
+
+    def suppliers():
+        api = make_spending_api(args)
+        run_clearspending(cleaned, spending, bench_keys(args), session=MockSession(clearspending=api),
+                          scheduler=make_scheduler(args))
+        return count_rows(cleaned), spending, api.stats()
+
+    def sharded():
+        # One process and one key pool per shard, like separate hosts
+        key_pools = [[f'bench-shard-{shard}-key-{i}' for i in range(args.keys)] for shard in range(args.shards)]
+        output = path('top_3_suppliers_sharded.csv')
+        run_sharded_clearspending(cleaned, output, key_pools, shard_dir=path('shards'),
+                                  session_factory=partial(spending_session, args.key_interval, args.retry_after,
+                                                          api_options(args)),
+                                  scheduler_options=scheduler_options(args))
+        return count_rows(cleaned), output, {}
+
+    def screen():
+        api = MockOpenSanctions(args.scale, **api_options(args))
+        run_screening(spending, screened, 'bench-key', session=MockSession(opensanctions=api))
+        return count_rows(spending), screened, api.stats()
+
+    def merge():
+        run_merge(cleaned, spending, merged)
+        return count_rows(cleaned) + count_rows(spending), merged, {}
+
+    def dedup():
+        run_final_clean(merged, final, path('entities.arrow'), resolve=True)
+        return count_rows(merged), final, {}
+
+    def translate():
+        client = MockTranslateClient(**api_options(args))
+        run_translation(final, translated, translate_client=client)
+        return count_rows(final), translated, client.stats()
+
+    def streaming():
+        stream_dir = path('streaming')
+        os.makedirs(stream_dir, exist_ok=True)
+        search_api = MockOpenSanctions(args.scale, **api_options(args))
+        spending_api = make_spending_api(args)
+        client = MockTranslateClient(**api_options(args))
+        session = MockSession(opensanctions=search_api, clearspending=spending_api)
+        run_streaming_pipeline(stream_dir, None, 'bench-key', bench_keys(args), session=session,
+                               scheduler=make_scheduler(args), translate_client=client)
+        stats = dict(session.stats(), translate=client.stats())
+        return args.scale, os.path.join(stream_dir, 'forImportGenius_no_duplicates.csv'), stats
+
+    stage_functions = {'opensanctions': opensanctions, 'bulk': bulk, 'clean': clean, 'suppliers': suppliers,
+                       'sharded': sharded, 'screen': screen, 'merge': merge, 'dedup': dedup, 'translate': translate, 'streaming': streaming}
+
+    results = {}
+    for stage in args.stages:
+        print(f"Benchmarking {stage}...", file=sys.stderr)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            start = time.perf_counter()
+            try:
+                rows_in, output, api_stats = stage_functions[stage]()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                error = None
+            seconds = time.perf_counter() - start
+        if error:
+            results[stage] = {'seconds': round(seconds, 4), 'error': error}
+            print(f"  failed after {seconds:.2f} s: {error}", file=sys.stderr)
+            continue
+        results[stage] = {
+            'seconds': round(seconds, 4),
+            'rows_in': rows_in,
+            'rows_out': count_rows(output),
+            'rows_per_second': round(rows_in / seconds, 1) if seconds else None,
+            'api': api_stats,
+        }
+        print(f"  {seconds:.2f} s, {rows_in} rows in, {results[stage]['rows_out']} rows out", file=sys.stderr)
+    return results
+
+def compare(current, baseline, tolerance):
+    """Print per-stage changes against a baseline result file; returns the stages that got slower."""
+    if current['config'] != baseline.get('config'):
+        print("Warning: the baseline was run with a different configuration.")
+    regressions = []
+    print(f"{'stage':<15}{'baseline s':>12}{'current s':>12}{'change':>10}")
+    for stage, result in current['stages'].items():
+        before = baseline.get('stages', {}).get(stage)
+        if 'error' in result:
+            regressions.append(stage)
+            print(f"{stage:<15}{'':>12}{'':>12}{'FAILED':>10}")
+            continue
+        if not before or 'error' in before:
+            print(f"{stage:<15}{'-':>12}{result['seconds']:>12.3f}{'new':>10}")
+            continue
+        change = result['seconds'] / before['seconds'] - 1 if before['seconds'] else 0.0
+        flag = ''
+        if change > tolerance:
+            regressions.append(stage)
+            flag = '  SLOWER'
+        print(f"{stage:<15}{before['seconds']:>12.3f}{result['seconds']:>12.3f}{change:>+10.1%}{flag}")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline throughput benchmarks for the pipeline stages.")
+    parser.add_argument('--scale', type=int, default=10000, help="number of synthetic sanctioned entities")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES,
+                        help="stages to run, in pipeline order (later stages need the outputs of earlier ones)")
+    parser.add_argument('--latency', type=float, default=0.0, help="simulated API latency per request, in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra random latency of up to this many seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of API requests answered with HTTP 500")
+    parser.add_argument('--keys', type=int, default=3, help="number of ClearSpending API keys")
+    parser.add_argument('--key-rate', type=float, default=10000.0, help="scheduler requests per second per key")
+    parser.add_argument('--key-burst', type=int, default=10, help="scheduler burst per key")
+    parser.add_argument('--key-interval', type=float, default=0.0,
+                        help="mock ClearSpending answers 429 when a key is reused within this many seconds")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After seconds sent with a 429")
+    parser.add_argument('--backoff', type=float, default=0.05, help="scheduler base backoff after a 429, in seconds")
+    parser.add_argument('--shards', type=int, default=4, help="processes (each with its own key pool) for 'sharded'")
+    parser.add_argument('--chunksize', type=int, default=None, help="chunk size for the cleaning stage")
+    parser.add_argument('--workdir', help="keep the stage outputs in this directory instead of a temporary one")
+    parser.add_argument('--output', help="write the JSON results to this file")
+    parser.add_argument('--compare', help="baseline JSON results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="fail when a stage is this much slower than the baseline (0.2 = 20%%)")
+    parser.add_argument('--verbose', action='store_true', help="show the stages' own output")
+    args = parser.parse_args(argv)
+    args.stages = [stage for stage in STAGES if stage in args.stages]
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = {key: value for key, value in vars(args).items()
+              if key not in ('workdir', 'output', 'compare', 'tolerance', 'verbose')}
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        stages = run_benchmarks(args, args.workdir)
+    else:
+        with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+            stages = run_benchmarks(args, workdir)
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': config,
+        'stages': stages,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Benchmark results saved to {args.output}")
+    else:
+        print(json.dumps(results, indent=2))
+
+    failed = [stage for stage, result in stages.items() if 'error' in result]
+    if failed:
+        print(f"Failed stages: {', '.join(failed)}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Slower than the baseline: {', '.join(regressions)}")
+            return 1
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
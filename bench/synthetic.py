@@ -0,0 +1,99 @@
+import gzip
+import json
+import random
+import numpy as np
+import pandas as pd
+from src.cleaningscriptv2 import INN10_WEIGHTS
+from src.OpenSanctionsv2 import DEFAULT_KEYWORDS, EXCLUDE_KEYWORDS
+
+# Word pools for synthetic company names, in Latin and Cyrillic script
+LATIN_WORDS = ['Zavod', 'Kontsern', 'Almaz', 'Ural', 'Tekhnologii', 'Mash', 'Priborostroenie', 'Radio', 'Elektron',
+               'Optika', 'Sistemy', 'Aviatsionnyy', 'Kompleks', 'Institut', 'Sudostroitelnyy', 'Motor', 'Neva', 'Volga']
+CYRILLIC_WORDS = ['Завод', 'Концерн', 'Алмаз', 'Урал', 'Технологии', 'Маш', 'Приборостроение', 'Радио', 'Электрон',
+                  'Оптика', 'Системы', 'Авиационный', 'Комплекс', 'Институт', 'Судостроительный', 'Мотор', 'Нева', 'Волга']
+LEGAL_FORMS = ['JSC', 'OJSC', 'LLC', 'PJSC', 'АО', 'ООО', 'ПАО', '']
+
+def make_inn(number, valid=True):
+    """Deterministic 10-digit INN built from `number`, with a correct (or deliberately wrong) check digit."""
+    body = f'{number % 10 ** 9:09d}'
+    check = int(np.dot([int(d) for d in body], INN10_WEIGHTS)) % 11 % 10
+    if not valid:
+        check = (check + 1) % 10
+    return body + str(check)
+
+def make_entity(index, keywords=DEFAULT_KEYWORDS, seed=0):
+    """Deterministic FollowTheMoney-style entity number `index`.
+
+    The mix mirrors real search results: about 10% persons, 5% entities that
+    match an exclude keyword, 10% with the INN only in taxNumber (some with a bad
+    checksum), 5% without any INN and 5% repeating an earlier INN.
+    """
+    rng = random.Random(seed * 1000003 + index)
+    words = CYRILLIC_WORDS if rng.random() < 0.3 else LATIN_WORDS
+    name = ' '.join(rng.sample(words, 3))
+    form = rng.choice(LEGAL_FORMS)
+    caption = f'{form} {name} {index}'.strip()
+
+    roll = rng.random()
+    schema = 'Person' if roll < 0.1 else 'Company'
+    if 0.1 <= roll < 0.15:
+        caption += ' ' + rng.choice(EXCLUDE_KEYWORDS)
+
+    properties = {'name': [caption], 'country': ['ru'], 'topics': ['sanction'], 'notes': [rng.choice(keywords)]}
+    roll = rng.random()
+    if roll < 0.05:
+        pass
+    elif roll < 0.15:
+        properties['taxNumber'] = [make_inn(index, valid=roll < 0.13)]
+    elif roll < 0.2 and index > 0:
+        properties['innCode'] = [make_inn(rng.randrange(index))]
+    else:
+        properties['innCode'] = [make_inn(index)]
+
+    return {'id': f'bench-{seed}-{index}', 'caption': caption, 'schema': schema, 'datasets': ['bench'],
+            'properties': properties}
+
+def iter_entities(count, keywords=DEFAULT_KEYWORDS, seed=0):
+    for index in range(count):
+        yield make_entity(index, keywords, seed)
+
+def write_bulk_file(path, count, keywords=DEFAULT_KEYWORDS, seed=0):
+    """Write `count` synthetic entities as an OpenSanctions bulk NDJSON export (.gz when the path says so)."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt', encoding='utf-8') as f:
+        for entity in iter_entities(count, keywords, seed):
+            f.write(json.dumps(entity, ensure_ascii=False))
+            f.write('\n')
+    return path
+
+def write_search_csv(path, count, seed=0):
+    """Write `count` synthetic rows in the format of run_opensanctions' output."""
+    rows = []
+    for entity in iter_entities(count, seed=seed):
+        properties = entity['properties']
+        rows.append({'id': entity['id'], 'caption': entity['caption'], 'schema': entity['schema'],
+                     'taxNumber': properties.get('taxNumber', [None])[0],
+                     'innCode': properties.get('innCode', [None])[0]})
+    pd.DataFrame(rows, columns=['id', 'caption', 'schema', 'taxNumber', 'innCode']).to_csv(path, index=False)
+    return path
+
+def contract_count(inn, mean=40):
+    """Deterministic number of contracts for a customer INN (0 for about a fifth of customers)."""
+    rng = random.Random(inn)
+    return 0 if rng.random() < 0.2 else rng.randint(1, 2 * mean)
+
+def make_contracts(inn, start, stop, suppliers=25):
+    """Contracts `start`..`stop` (sorted by amount, descending) of the customer `inn`."""
+    base = int(inn) if inn and inn.isdigit() else 0
+    contracts = []
+    for position in range(start, stop):
+        supplier = (base + position * 7919) % suppliers
+        supplier_inn = make_inn(base * 31 + supplier)
+        contracts.append({
+            'customer_inn': inn,
+            'supplier_inns': [supplier_inn],
+            'supplier_names': [f'Postavshchik {supplier_inn[:6]} {supplier}'],
+            'amount_rur': float(10 ** 7 // (position + 1)),
+            'sign_date': '2020-01-01',
+        })
+    return contracts
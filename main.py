@@ -1,14 +1,42 @@
+import argparse
+import atexit
+import datetime
 import os
-from src.OpenSanctionsv2 import run_opensanctions  # OpenSanctions script
-from src.cleaningscriptv2 import run_cleaning      # Cleaning script
-from src.clearspendingv5 import run_clearspending  # ClearSpending script
-from src.datamerge import run_merge                # Merge script
-from src.final_clean import run_final_clean        # Final clean script
-from src.translate import run_translation          # Translation script
+import sys
+from src import metrics  # Run report and Prometheus metrics (standard library only)
+
+# Stage modules pull in pandas, requests, pyarrow and the Google SDK, so each
+# command imports only what it runs; `python main.py check-imports` keeps the
+# CLI itself within its start-up budget.
 
 # Set the default location for the Google Translate API key
 GOOGLE_CREDENTIALS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "your-google-translate-api-key.json")
 
+# Output directory, relative to this script
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output")
+
+# Set RU_SUPPLIERS_CACHE_ONLY=1 to answer every API call from the response cache (no network)
+CACHE_ONLY = os.environ.get("RU_SUPPLIERS_CACHE_ONLY") == "1"
+
+# Set RU_SUPPLIERS_METRICS=1 to write output/run_report.json and output/metrics.prom
+METRICS = os.environ.get("RU_SUPPLIERS_METRICS") == "1"
+
+# Files written by each stage, inside the output directory
+STAGE_FILES = {
+    'opensanctions': "sanctioned_entities_with_inn.csv",
+    'cleaned': "data_cleaned_finalv2.csv",
+    'suppliers': "top_3_suppliers_by_companyv2.csv",
+    'supplier_store': "supplier_aggregates.sqlite",
+    'screened': "suppliers_screened.csv",
+    'graph': "supplier_graph_edges.csv",
+    'shards': "shards",
+    'cache': "http_cache.sqlite",
+    'merged': "merged.arrow",
+    'final': "forImportGenius_no_duplicates.csv",
+    'store': "entities.arrow",
+    'translated': "data_request.csv",
+}
+
 def get_api_keys():
     """Prompt the user to enter the necessary API keys."""
     open_sanctions_key = input("Please enter your OpenSanctions API Key: ").strip()
@@ -61,6 +89,14 @@ def get_keywords_preset():
         else:
             print("Invalid choice. Please enter 1 or 2.")
 
+def get_bulk_file():
+    """Prompt the user for an optional OpenSanctions bulk export to use instead of the search API."""
+    while True:
+        path = input("\nPath to an OpenSanctions bulk export (press Enter to use the search API): ").strip()
+        if not path or os.path.exists(path):
+            return path or None
+        print(f"File {path} does not exist.")
+
 def check_file_exists(filepath):
     """Check if a file exists before proceeding to the next step."""
     if os.path.exists(filepath):
@@ -70,75 +106,456 @@ def check_file_exists(filepath):
         print(f"Error: File {filepath} does not exist.")
         return False
 
-def main():
+def write_metrics(output_dir):
+    """Write the run report and the Prometheus textfile of the metrics collected so far."""
+    registry = metrics.active()
+    if registry is None:
+        return
+    report_file = os.path.join(output_dir, "run_report.json")
+    registry.write_json(report_file)
+    registry.write_prometheus(os.path.join(output_dir, "metrics.prom"))
+    print(f"Run report saved to {report_file}")
+
+def prepare_output_dir(output_dir, collect_metrics=METRICS):
+    """Create the output directory and, if requested, start collecting metrics for the run."""
+    os.makedirs(output_dir, exist_ok=True)
+    if collect_metrics and metrics.active() is None:
+        metrics.enable()
+        atexit.register(write_metrics, output_dir)
+
+def stage_files(output_dir):
+    return {name: os.path.join(output_dir, filename) for name, filename in STAGE_FILES.items()}
+
+def open_cache(output_dir):
+    """Responses are cached across runs, so reruns with unchanged inputs barely touch the APIs."""
+    from src.cache import ResponseCache
+    return ResponseCache(os.path.join(output_dir, STAGE_FILES['cache']), offline=CACHE_ONLY)
+
+def open_manifest(output_dir):
+    """Stages whose inputs are unchanged since their last completed run are skipped."""
+    from src.checkpoint import Manifest
+    return Manifest(os.path.join(output_dir, "manifest.json"))
+
+def open_entity_index(index_file, bulk_file=None, cache=None):
+    """Load a saved local entity index, or build it from a bulk export (or the cached search responses) and save it."""
+    from src.matcher import EntityIndex
+    if os.path.exists(index_file) and not bulk_file:
+        return EntityIndex.load(index_file)
+    if bulk_file:
+        print(f"Building the local entity index from {bulk_file}...")
+        index = EntityIndex.from_bulk(bulk_file)
+    else:
+        print("Building the local entity index from the cached OpenSanctions search responses...")
+        index = EntityIndex.from_cache(cache)
+    index.save(index_file)
+    print(f"Indexed {len(index)} entities into {index_file}")
+    return index
+
+def stage_fetch(files, manifest, keywords, sanctions_api_key=None, bulk_file=None, cache=None, force=False,
+                index_file=None):
+    """Step 1: fetch sanctioned entities from the OpenSanctions API, a bulk export or a local entity index."""
+    from src.checkpoint import run_stage
+    from src.OpenSanctionsv2 import combine_keywords
+    output = files['opensanctions']
+    # Every source answers the same preset: the default keywords plus the user's
+    preset = combine_keywords(keywords)
+    if index_file:
+        from src.bulkingest import run_index_opensanctions
+        print(f"Answering the keyword preset from the local index {index_file}... Output will be saved to: {output}")
+        return run_stage(manifest, "opensanctions",
+                         lambda: run_index_opensanctions(open_entity_index(index_file, bulk_file, cache), output, preset),
+                         inputs=[path for path in (index_file, bulk_file) if path], outputs=[output],
+                         params={'keywords': preset, 'index': True}, force=force)
+    if bulk_file:
+        from src.bulkingest import run_bulk_opensanctions
+        print(f"Running OpenSanctions bulk ingestion... Output will be saved to: {output}")
+        return run_stage(manifest, "opensanctions", lambda: run_bulk_opensanctions(bulk_file, output, preset),
+                         inputs=[bulk_file], outputs=[output], params={'keywords': preset}, force=force)
+    from src.OpenSanctionsv2 import run_opensanctions
+    print(f"Running OpenSanctions script... Output will be saved to: {output}")
+    return run_stage(manifest, "opensanctions", lambda: run_opensanctions(sanctions_api_key, output, keywords, cache=cache),
+                     outputs=[output], params={'keywords': preset}, force=force)
+
+def stage_clean(files, manifest, chunksize=None, force=False):
+    """Step 2: clean the entities and fill in missing INNs."""
+    from src.checkpoint import run_stage
+    from src.cleaningscriptv2 import run_cleaning
+    print(f"Running cleaning script... Reading from: {files['opensanctions']}, Output to: {files['cleaned']}")
+    return run_stage(manifest, "clean", lambda: run_cleaning(files['opensanctions'], files['cleaned'], chunksize),
+                     inputs=[files['opensanctions']], outputs=[files['cleaned']], force=force)
+
+def stage_suppliers(files, manifest, clearspending_api_keys, cache=None, force=False, start_date=None, end_date=None,
+                    window_months=None):
+    """Step 3: find the top suppliers of every entity (resumes per company if interrupted).
+
+    Supplier totals and per-company watermarks are kept in the output directory,
+    so later runs only fetch contracts signed since each company's last sync.
+    """
+    from src.checkpoint import run_stage
+    from src.clearspendingv5 import START_DATE, END_DATE, run_clearspending
+    from src.supplier_store import SupplierStore
+    start_date = start_date or START_DATE
+    end_date = end_date or END_DATE
+    print(f"Running ClearSpending script for contracts from {start_date} to {end_date}... Output to: {files['suppliers']}")
+    store = SupplierStore(files['supplier_store'])
+    try:
+        return run_stage(manifest, "suppliers",
+                         lambda: run_clearspending(files['cleaned'], files['suppliers'], clearspending_api_keys,
+                                                   cache=cache, start_date=start_date, end_date=end_date, store=store,
+                                                   window_months=window_months),
+                         inputs=[files['cleaned']], outputs=[files['suppliers']],
+                         params={'start_date': start_date, 'end_date': end_date}, force=force)
+    finally:
+        store.close()
+
+def stage_suppliers_sharded(files, manifest, key_pools, shards, shard_index=None, merge_only=False, force=False,
+                            start_date=None, end_date=None, window_months=None):
+    """Step 3, sharded: one process (or host) and one key pool per shard of the entities.
+
+    With `shard_index`, only that shard runs and its output is left in the
+    shards directory, to be merged once every host is done (`merge_only`).
+    """
+    from src.checkpoint import run_stage
+    from src.clearspendingv5 import START_DATE, END_DATE
+    from src.sharding import merge_shard_outputs, run_sharded_clearspending, shard_path
+    start_date = start_date or START_DATE
+    end_date = end_date or END_DATE
+    params = {'start_date': start_date, 'end_date': end_date}
+    shard_base = os.path.join(files['shards'], os.path.basename(files['suppliers']))
+
+    if merge_only:
+        outputs = [shard_path(shard_base, index, shards) for index in range(shards)]
+        missing = [path for path in outputs if not os.path.exists(path)]
+        if missing:
+            print(f"Missing shard outputs: {', '.join(missing)}")
+            return False
+
+        def merge_shards():
+            rows = merge_shard_outputs(outputs, files['suppliers'])
+            print(f"Merged {shards} shard outputs into {files['suppliers']} ({rows} rows)")
+
+        return run_stage(manifest, "suppliers", merge_shards, inputs=[files['cleaned']], outputs=[files['suppliers']],
+                         params=params, force=force)
+
+    def run_shards():
+        return run_sharded_clearspending(files['cleaned'], files['suppliers'], key_pools, shards, files['shards'],
+                                         only_shard=shard_index, cache_file=files['cache'], cache_offline=CACHE_ONLY,
+                                         store_file=files['supplier_store'], start_date=start_date,
+                                         end_date=end_date, window_months=window_months)
+
+    print(f"Running ClearSpending script in {shards} shards for contracts from {start_date} to {end_date}...")
+    if shard_index is not None:
+        # One host's share of the work; the stage completes when the shards are merged
+        return run_shards()
+    return run_stage(manifest, "suppliers", run_shards, inputs=[files['cleaned']], outputs=[files['suppliers']],
+                     params=params, force=force)
+
+def stage_screen(files, manifest, sanctions_api_key, cache=None, force=False):
+    """Step 3b: screen the suppliers against the sanctions lists (batched OpenSanctions /match requests)."""
+    from src.checkpoint import run_stage
+    from src.screening import run_screening
+    print(f"Running sanctions screening of suppliers... Output to: {files['screened']}")
+    return run_stage(manifest, "screen",
+                     lambda: run_screening(files['suppliers'], files['screened'], sanctions_api_key, cache=cache),
+                     inputs=[files['suppliers']], outputs=[files['screened']], force=force)
+
+def stage_graph(files, manifest, clearspending_api_keys, cache=None, graphml_file=None, depth=2, fan_out=3,
+                force=False):
+    """Optional step: crawl the multi-tier supplier graph (suppliers of suppliers) of the cleaned entities."""
+    from src.checkpoint import run_stage
+    from src.supplier_graph import run_supplier_graph
+    print(f"Crawling the supplier graph {depth} tiers deep... Output to: {files['graph']}")
+    outputs = [files['graph']] + ([graphml_file] if graphml_file else [])
+    return run_stage(manifest, "graph",
+                     lambda: run_supplier_graph(files['cleaned'], files['graph'], clearspending_api_keys,
+                                                graphml_file=graphml_file, depth=depth, fan_out=fan_out, cache=cache),
+                     inputs=[files['cleaned']], outputs=outputs, params={'depth': depth, 'fan_out': fan_out},
+                     force=force)
+
+def stage_merge(files, manifest, force=False):
+    """Step 4: merge entities and suppliers into the typed store."""
+    from src.checkpoint import run_stage
+    from src.datamerge import run_merge
+    suppliers_file = files['suppliers']
+    # Use the screened suppliers, which carry their sanctions match, unless they predate the suppliers file
+    if os.path.exists(files['screened']) and (not os.path.exists(suppliers_file) or
+                                              os.path.getmtime(files['screened']) >= os.path.getmtime(suppliers_file)):
+        suppliers_file = files['screened']
+    print(f"Running merging script... Reading suppliers from: {suppliers_file}, Output to: {files['merged']}")
+    return run_stage(manifest, "merge", lambda: run_merge(files['cleaned'], suppliers_file, files['merged']),
+                     inputs=[files['cleaned'], suppliers_file], outputs=[files['merged']], force=force)
+
+def stage_dedup(files, manifest, resolve=True, force=False, with_screening=False):
+    """Step 5: remove duplicate entities and export the ImportGenius-style CSV."""
+    from src.checkpoint import run_stage
+    from src.final_clean import run_final_clean
+    print(f"Running final cleaning script... Output to: {files['final']}")
+    return run_stage(manifest, "dedup",
+                     lambda: run_final_clean(files['merged'], files['final'], files['store'], resolve=resolve,
+                                             with_screening=with_screening),
+                     inputs=[files['merged']], outputs=[files['final'], files['store']],
+                     params={'resolve': resolve, 'with_screening': with_screening}, force=force)
+
+def stage_translate(files, manifest, memo_file, google_credentials=GOOGLE_CREDENTIALS_FILE, force=False):
+    """Step 6: translate the names (translations are memoized across runs)."""
+    from src.checkpoint import run_stage
+    from src.translate import run_translation
+    print(f"Running translation script... Output to: {files['translated']}")
+    return run_stage(manifest, "translate",
+                     lambda: run_translation(files['final'], files['translated'], google_credentials, memo_file=memo_file),
+                     inputs=[files['final']], outputs=[files['translated']], force=force)
+
+def run_all(output_dir, sanctions_api_key, clearspending_api_keys, keywords, bulk_file=None, streaming=False,
+            force=False):
+    """Run every stage in order, skipping stages whose inputs are unchanged since their last run."""
+    cache = open_cache(output_dir)
+
+    # Translations are memoized across runs, so a name is never sent to the API twice
+    memo_file = os.path.join(output_dir, "translation_memo.sqlite")
+
+    # Streaming mode: run every stage concurrently and pass records through queues
+    if streaming:
+        from src.pipeline import run_streaming_pipeline
+        from src.translate import TranslationMemo
+        print("Running all stages as a streaming pipeline...")
+        with metrics.stage("streaming"):
+            completed = run_streaming_pipeline(output_dir, keywords, sanctions_api_key, clearspending_api_keys,
+                                               GOOGLE_CREDENTIALS_FILE, bulk_file=bulk_file, cache=cache,
+                                               memo=TranslationMemo(memo_file))
+        if completed:
+            print("All steps completed successfully.")
+        return completed
+
+    manifest = open_manifest(output_dir)
+    files = stage_files(output_dir)
+    steps = [
+        ('opensanctions', lambda: stage_fetch(files, manifest, keywords, sanctions_api_key, bulk_file, cache, force)),
+        ('cleaned', lambda: stage_clean(files, manifest, force=force)),
+        ('suppliers', lambda: stage_suppliers(files, manifest, clearspending_api_keys, cache, force)),
+        ('screened', lambda: stage_screen(files, manifest, sanctions_api_key, cache, force)),
+        ('merged', lambda: stage_merge(files, manifest, force)),
+        ('final', lambda: stage_dedup(files, manifest, force=force)),
+        ('translated', lambda: stage_translate(files, manifest, memo_file, force=force)),
+    ]
+    if not sanctions_api_key:
+        # Screening needs an OpenSanctions key, which runs from a bulk export may not have
+        print("No OpenSanctions API key: skipping the sanctions screening of suppliers.")
+        steps = [(output, step) for output, step in steps if output != 'screened']
+    for output, step in steps:
+        completed = step()
+
+        # Check if the stage's output file was created before proceeding
+        if not check_file_exists(files[output]):
+            if output == 'opensanctions':
+                print("OpenSanctions script did not create the output file. Please check the API key or script.")
+            return False  # Exit if the file is not created
+
+        # A stage that stopped early (e.g. out of API quota) leaves a partial output; later stages must not use it
+        if not completed:
+            print(f"The {output} stage did not finish. Rerun to resume it before the later stages run.")
+            return False
+
+    print("All steps completed successfully.")
+    return True
+
+def main(streaming=False):
+    """Interactive run: prompt for keys, keywords and an optional bulk export, then run every stage."""
     # Get API keys from user input
     sanctions_api_key, clearspending_api_keys = get_api_keys()
 
     # Get keywords preset from user input
     keywords = get_keywords_preset()
 
-    # Get current working directory (where the script is run)
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    # Output directory should be relative to the current directory
-    output_dir = os.path.join(current_dir, "output")
-    
-    # Ensure output directory exists
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    # Step 1: Run OpenSanctions script to generate the first CSV file
-    opensanctions_output = os.path.join(output_dir, "sanctioned_entities_with_inn.csv")
-    print(f"Running OpenSanctions script... Output will be saved to: {opensanctions_output}")
-    run_opensanctions(sanctions_api_key, opensanctions_output, keywords)
-    
-    # Check if the OpenSanctions output file was created before proceeding
-    if not check_file_exists(opensanctions_output):
-        print("OpenSanctions script did not create the output file. Please check the API key or script.")
-        return  # Exit if the file is not created
-    
-    # Step 2: Run cleaning script after OpenSanctions output is ready
-    cleaned_output = os.path.join(output_dir, "data_cleaned_finalv2.csv")
-    print(f"Running cleaning script... Reading from: {opensanctions_output}, Output to: {cleaned_output}")
-    run_cleaning(opensanctions_output, cleaned_output)
-    
-    # Check if the cleaning output file was created before proceeding
-    if not check_file_exists(cleaned_output):
-        return  # Exit if the file is not created
-    
-    # Step 3: Run ClearSpending script after cleaning
-    spending_output = os.path.join(output_dir, "top_3_suppliers_by_companyv2.csv")
-    print(f"Running ClearSpending script... Output to: {spending_output}")
-    run_clearspending(cleaned_output, spending_output, clearspending_api_keys)
-    
-    # Check if the ClearSpending output file was created before proceeding
-    if not check_file_exists(spending_output):
-        return  # Exit if the file is not created
-    
-    # Step 4: Run merging script after ClearSpending data is ready
-    merge_output = os.path.join(output_dir, "forImportGenius.csv")
-    print(f"Running merging script... Output to: {merge_output}")
-    run_merge(cleaned_output, spending_output, merge_output)
-    
-    # Check if the merge output file was created before proceeding
-    if not check_file_exists(merge_output):
-        return  # Exit if the file is not created
-    
-    # Step 5: Run final cleaning script after merging
-    final_output = os.path.join(output_dir, "forImportGenius_no_duplicates.csv")
-    print(f"Running final cleaning script... Output to: {final_output}")
-    run_final_clean(merge_output, final_output)
-    
-    # Check if the final cleaned output file was created before proceeding
-    if not check_file_exists(final_output):
-        return  # Exit if the file is not created
-    
-    # Step 6: Run translation script as the last step
-    translated_output = os.path.join(output_dir, "data_request.csv")
-    print(f"Running translation script... Output to: {translated_output}")
-    run_translation(final_output, translated_output, GOOGLE_CREDENTIALS_FILE)
+    # Optionally read entities from a local bulk export instead of the search API
+    bulk_file = get_bulk_file()
 
-    print("All steps completed successfully.")
+    prepare_output_dir(DEFAULT_OUTPUT_DIR)
+    run_all(DEFAULT_OUTPUT_DIR, sanctions_api_key, clearspending_api_keys, keywords, bulk_file, streaming)
+
+def main_batch(config_file):
+    """Run all jobs of a batch config file without any prompts."""
+    from src.batch import load_batch_config, run_batch
+    config = load_batch_config(config_file)
+    prepare_output_dir(config['output_dir'])
+    status = run_batch(config, google_credentials=config.get('google_credentials') or (
+        GOOGLE_CREDENTIALS_FILE if os.path.exists(GOOGLE_CREDENTIALS_FILE) else None))
+    if all(status.values()):
+        print("All jobs completed successfully.")
+    return all(status.values())
+
+def env_api_keys():
+    """API keys for non-interactive runs, read from the environment."""
+    sanctions_api_key = os.environ.get("OPENSANCTIONS_API_KEY")
+    clearspending_api_keys = [key.strip() for key in os.environ.get("CLEARSPENDING_API_KEYS", "").split(",") if key.strip()]
+    return sanctions_api_key, clearspending_api_keys
+
+def env_key_pools(clearspending_api_keys, shards):
+    """ClearSpending key pools for sharded runs: CLEARSPENDING_KEY_POOLS (pools separated by ';'), or the keys dealt out."""
+    from src.sharding import split_key_pools
+    pools = [[key.strip() for key in pool.split(",") if key.strip()]
+             for pool in os.environ.get("CLEARSPENDING_KEY_POOLS", "").split(";")]
+    pools = [pool for pool in pools if pool]
+    return pools or split_key_pools(clearspending_api_keys, shards)
+
+# Stage commands: (input file, output file) each one reads and writes, overridable with --input/--output
+STAGE_COMMANDS = {
+    'fetch': (None, 'opensanctions'),
+    'clean': ('opensanctions', 'cleaned'),
+    'suppliers': ('cleaned', 'suppliers'),
+    'screen': ('suppliers', 'screened'),
+    'graph': ('cleaned', 'graph'),
+    'merge': (None, 'merged'),
+    'dedup': ('merged', 'final'),
+    'translate': ('final', 'translated'),
+}
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Collect sanctioned Russian military companies and their suppliers. "
+                    "Without a command, the full pipeline runs interactively.")
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, help="directory for all stage files")
+    parser.add_argument('--metrics', action='store_true', default=METRICS,
+                        help="write run_report.json and metrics.prom (also RU_SUPPLIERS_METRICS=1)")
+    parser.add_argument('--stream', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--batch', metavar='CONFIG', help=argparse.SUPPRESS)
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    keys_help = "API keys are read from OPENSANCTIONS_API_KEY and CLEARSPENDING_API_KEYS (comma-separated)."
+    fetch = commands.add_parser('fetch', help="fetch sanctioned entities from OpenSanctions", description=keys_help)
+    clean = commands.add_parser('clean', help="clean the fetched entities")
+    suppliers = commands.add_parser('suppliers', help="find each entity's top suppliers on ClearSpending",
+                                    description=keys_help)
+    commands.add_parser('screen', help="screen the suppliers against the sanctions lists", description=keys_help)
+    graph = commands.add_parser('graph', help="crawl the suppliers of the suppliers (tier 2, 3, ...) on ClearSpending",
+                                description=keys_help)
+    commands.add_parser('merge', help="merge entities and suppliers into one store")
+    dedup = commands.add_parser('dedup', help="deduplicate and export the ImportGenius-style CSV")
+    translate = commands.add_parser('translate', help="translate the names with Google Translate")
+    run_all_parser = commands.add_parser('all', help="run every stage without prompts", description=keys_help)
+    batch = commands.add_parser('batch', help="run the jobs of a batch config file")
+    check = commands.add_parser('check-imports', help="check the CLI's import time against its budget")
+
+    for command, (input_name, output_name) in STAGE_COMMANDS.items():
+        command_parser = commands.choices[command]
+        if input_name:
+            command_parser.add_argument('--input', help=f"input file (default: {STAGE_FILES[input_name]})")
+        command_parser.add_argument('--output', help=f"output file (default: {STAGE_FILES[output_name]})")
+
+    for command_parser in (fetch, run_all_parser):
+        command_parser.add_argument('--keywords', nargs='*', default=[], help="keywords added to the default preset")
+        command_parser.add_argument('--bulk-file', help="read entities from an OpenSanctions bulk export instead")
+    fetch.add_argument('--index', metavar='FILE',
+                       help="answer the keywords from a local entity index instead of the API; the index is built "
+                            "from --bulk-file (or the cached search responses) when given or when FILE is missing")
+    clean.add_argument('--chunksize', type=int, help="stream the input in chunks of this many rows")
+    suppliers.add_argument('--start-date', help="count contracts signed from this date (default: 2014-07-31)")
+    suppliers.add_argument('--end-date', help="count contracts signed up to this date (default: 2022-02-23)")
+    suppliers.add_argument('--refresh', action='store_true',
+                           help="count contracts up to today, fetching only those signed since the last sync")
+    suppliers.add_argument('--window-months', type=int,
+                           help="split each company's date range into sub-ranges of this many months, fetched in parallel")
+    suppliers.add_argument('--shards', type=int,
+                           help="split the entities into this many shards by INN, each run in its own process "
+                                "with its own key pool (CLEARSPENDING_KEY_POOLS=k1,k2;k3,k4 or the keys dealt out)")
+    suppliers.add_argument('--shard-index', type=int,
+                           help="run only this shard (0-based), e.g. one per host; merge later with --merge-shards")
+    suppliers.add_argument('--merge-shards', action='store_true',
+                           help="only merge the shard outputs in the shards directory into the suppliers file")
+    graph.add_argument('--depth', type=int, default=2, help="number of supplier tiers to crawl (default: 2)")
+    graph.add_argument('--fan-out', type=int, default=3, help="top suppliers followed per company (default: 3)")
+    graph.add_argument('--graphml', metavar='FILE', help="also write the graph as GraphML")
+    dedup.add_argument('--no-resolve', dest='resolve', action='store_false', help="only remove exact INN duplicates")
+    dedup.add_argument('--with-screening', action='store_true',
+                       help="add each supplier's sanctions score and status (from screen) to the exported CSV")
+    translate.add_argument('--credentials', default=GOOGLE_CREDENTIALS_FILE, help="Google service-account JSON file")
+    run_all_parser.add_argument('--stream', action='store_true', help="run all stages at once as a streaming pipeline")
+    run_all_parser.add_argument('--force', action='store_true', help="rerun stages even if their inputs are unchanged")
+    batch.add_argument('config', help="batch config file (JSON)")
+    check.add_argument('--budget-ms', type=float, help="import-time budget for the CLI, in milliseconds")
+    return parser
+
+def run_command(args):
+    """Run one CLI command. Returns True on success."""
+    if args.command == 'check-imports':
+        from src.importcheck import check_import_budget
+        return check_import_budget(args.budget_ms)
+    if args.command == 'batch':
+        return main_batch(args.config)
+
+    prepare_output_dir(args.output_dir, args.metrics)
+    sanctions_api_key, clearspending_api_keys = env_api_keys()
+    if args.command == 'all':
+        return run_all(args.output_dir, sanctions_api_key, clearspending_api_keys, args.keywords, args.bulk_file,
+                       args.stream, args.force)
+
+    files = stage_files(args.output_dir)
+    input_name, output_name = STAGE_COMMANDS[args.command]
+    if input_name and args.input:
+        files[input_name] = args.input
+    if args.output:
+        files[output_name] = args.output
+    manifest = open_manifest(args.output_dir)
+
+    # A stage run on its own always runs, and records its inputs for later `all` runs
+    if args.command == 'fetch':
+        if not args.bulk_file and not args.index and not sanctions_api_key:
+            print("Set OPENSANCTIONS_API_KEY or pass --bulk-file or --index.")
+            return False
+        return stage_fetch(files, manifest, args.keywords, sanctions_api_key, args.bulk_file,
+                           open_cache(args.output_dir), force=True, index_file=args.index)
+    if args.command == 'clean':
+        return stage_clean(files, manifest, args.chunksize, force=True)
+    if args.command == 'suppliers':
+        if not clearspending_api_keys and not args.merge_shards:
+            print("Set CLEARSPENDING_API_KEYS to one or more comma-separated keys.")
+            return False
+        end_date = datetime.date.today().isoformat() if args.refresh else args.end_date
+        if args.shards:
+            return stage_suppliers_sharded(files, manifest, env_key_pools(clearspending_api_keys, args.shards),
+                                           args.shards, args.shard_index, args.merge_shards, force=True,
+                                           start_date=args.start_date, end_date=end_date,
+                                           window_months=args.window_months)
+        return stage_suppliers(files, manifest, clearspending_api_keys, open_cache(args.output_dir), force=True,
+                               start_date=args.start_date, end_date=end_date, window_months=args.window_months)
+    if args.command == 'screen':
+        if not sanctions_api_key:
+            print("Set OPENSANCTIONS_API_KEY to screen the suppliers.")
+            return False
+        return stage_screen(files, manifest, sanctions_api_key, open_cache(args.output_dir), force=True)
+    if args.command == 'graph':
+        if not clearspending_api_keys:
+            print("Set CLEARSPENDING_API_KEYS to one or more comma-separated keys.")
+            return False
+        return stage_graph(files, manifest, clearspending_api_keys, open_cache(args.output_dir), args.graphml,
+                           args.depth, args.fan_out, force=True)
+    if args.command == 'merge':
+        return stage_merge(files, manifest, force=True)
+    if args.command == 'dedup':
+        return stage_dedup(files, manifest, args.resolve, force=True, with_screening=args.with_screening)
+    if args.command == 'translate':
+        return stage_translate(files, manifest, os.path.join(args.output_dir, "translation_memo.sqlite"),
+                               args.credentials, force=True)
+
+def check_shard_args(parser, args):
+    """Reject shard options that cannot run: they need --shards, and --shard-index must name one of its shards."""
+    if args.shards is not None and args.shards < 1:
+        parser.error("--shards must be at least 1")
+    if (args.merge_shards or args.shard_index is not None) and not args.shards:
+        parser.error("--shard-index and --merge-shards need --shards")
+    if args.shard_index is not None and not 0 <= args.shard_index < args.shards:
+        parser.error(f"--shard-index must be between 0 and {args.shards - 1} for --shards {args.shards}")
+
+def cli(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'suppliers':
+        check_shard_args(parser, args)
+    if args.batch:  # Older spelling of the batch command
+        return 0 if main_batch(args.batch) else 1
+    if args.command is None:
+        main(streaming=args.stream)
+        return 0
+    return 0 if run_command(args) else 1
 
 if __name__ == "__main__":
-    main()
+    sys.exit(cli())
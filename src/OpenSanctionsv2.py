@@ -1,111 +1,207 @@
-import requests
-import pandas as pd
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import csv
+import os
+from src import metrics
+from src.session import make_session
+from src.cache import cached_get_json
+from src.matcher import KeywordMatcher
 
-def run_opensanctions(api_key, output_path, additional_keywords=None):
-    """Run the OpenSanctions data fetch with user-specified keywords."""
-    
-    print("Running OpenSanctions with the following output path:", output_path)
-    
-    # Default keywords for sanctioned companies in Russia
-    default_keywords = [
-        'military production', 'weapons manufacture', 'arms industry', 'aerospace',
-        'shipbuilding', 'military research', 'tank production', 'aircraft production'
-    ]
+SEARCH_URL = 'https://api.opensanctions.org/search/sanctions'
+
+# Default keywords for sanctioned companies in Russia
+DEFAULT_KEYWORDS = [
+    'military production', 'weapons manufacture', 'arms industry', 'aerospace',
+    'shipbuilding', 'military research', 'tank production', 'aircraft production'
+]
+
+EXCLUDE_KEYWORDS = [
+    'political', 'bank', 'PMC', 'finance', 'insurance', 'fund', 'investment', 
+    'lobbying', 'military organization', 'political groups',
+    'media', 'propaganda', 'ministry', 'agency'
+]
 
-    # Combine default keywords with any additional keywords from the user
+# Columns kept from each search result
+ENTITY_COLUMNS = ['id', 'caption', 'schema', 'taxNumber', 'innCode']
+
+# Compact record of one search result: a tuple, so there is no per-record dict
+EntityRecord = namedtuple('EntityRecord', ENTITY_COLUMNS)
+
+def project_result(result):
+    """Reduce a search result to an EntityRecord, dropping the rest of its payload."""
+    properties = result.get('properties') or {}
+    return EntityRecord(
+        result.get('id'),
+        result.get('caption'),
+        result.get('schema'),
+        (properties.get('taxNumber') or [None])[0],
+        (properties.get('innCode') or [None])[0],
+    )
+
+def combine_keywords(additional_keywords=None):
+    """Combine default keywords with any additional keywords from the user."""
     if additional_keywords:
-        keywords = default_keywords + additional_keywords
-    else:
-        keywords = default_keywords
+        return DEFAULT_KEYWORDS + additional_keywords
+    return DEFAULT_KEYWORDS
 
-    exclude_keywords = [
-        'political', 'bank', 'PMC', 'finance', 'insurance', 'fund', 'investment', 
-        'lobbying', 'military organization', 'political groups',
-        'media', 'propaganda', 'ministry', 'agency'
-    ]
+def iter_opensanctions_pages(api_key, keywords, max_in_flight=8, session=None, cache=None, ordered=False):
+    """Fetch all result pages for `keywords` concurrently, yielding (keyword, offset, records) as pages arrive.
 
-    all_results = []
+    Each page is projected to EntityRecords in the worker thread that fetched
+    it, with excluded entities already removed, so the full result payloads are
+    dropped as soon as a page is parsed. With `ordered`, pages are yielded in
+    keyword and offset order instead; only pages that arrive ahead of their turn
+    are held back.
+    """
     batch_size = 100
-    more_results = True
-
-    def extract_tax_info(properties):
-        tax_info = {'taxNumber': None, 'innCode': None}
-        tax_info['taxNumber'] = properties.get('taxNumber', [None])[0]
-        tax_info['innCode'] = properties.get('innCode', [None])[0]
-        return tax_info
-
-    for keyword in keywords:
-        print(f"Searching for keyword: {keyword}")
-        offset = 0
-        while more_results:
-            query_params = {
-                'q': keyword,
-                'countries': 'RU',  # Focus on Russian companies
-                'schema': 'LegalEntity',  # Ensure we're dealing with legal entities
-                'topics': 'sanction',  # Include only sanctioned entities
-                'fuzzy': 'true',
-                'limit': batch_size,
-                'offset': offset
-            }
-            headers = {'Authorization': f'Bearer {api_key}'}
+    headers = {'Authorization': f'Bearer {api_key}'}
+    exclude_matcher = KeywordMatcher(EXCLUDE_KEYWORDS)
+
+    # Share one pooled session across all worker threads
+    if session is None:
+        session = make_session(pool_size=max_in_flight)
+
+    def fetch_page(keyword, offset):
+        """Fetch one page of results for a keyword. Returns (records, page size, total) or None on failure."""
+        query_params = {
+            'q': keyword,
+            'countries': 'RU',  # Focus on Russian companies
+            'schema': 'LegalEntity',  # Ensure we're dealing with legal entities
+            'topics': 'sanction',  # Include only sanctioned entities
+            'fuzzy': 'true',
+            'limit': batch_size,
+            'offset': offset
+        }
+
+        print(f"Sending request to OpenSanctions API... ({keyword}, offset {offset})")
+        try:
+            data, response = cached_get_json(session, SEARCH_URL, params=query_params, headers=headers, cache=cache)
             
-            print("Sending request to OpenSanctions API...")
-            try:
-                response = requests.get('https://api.opensanctions.org/search/sanctions', headers=headers, params=query_params)
-                
-                # Print the status of the request
+            # Print the status of the request
+            if response is not None:
                 print(f"Response status code: {response.status_code}")
-                
-                # Check if the request was successful
-                if response.status_code == 200:
-                    data = response.json()
-                    results = data.get('results', [])
-                    
-                    # If no results are returned
-                    if not results:
-                        print(f"No results found for keyword: {keyword}")
-                    
-                    # Process each result
-                    for result in results:
-                        entity_caption = result.get('caption', '').lower()
-                        entity_properties = result.get('properties', {})
-                        
-                        # Skip excluded entities
-                        if any(exclude_kw in entity_caption for exclude_kw in exclude_keywords):
-                            continue
-                        
-                        # Extract tax information
-                        tax_info = extract_tax_info(entity_properties)
-                        result['taxNumber'] = tax_info['taxNumber']
-                        result['innCode'] = tax_info['innCode']
-                        all_results.append(result)
-
-                    # If the results are less than the batch size, stop pagination
-                    if len(results) < batch_size:
-                        more_results = False
-                    else:
-                        offset += batch_size  # Move to the next page of results
-                else:
-                    print(f"Error: {response.status_code} - {response.text}")
-                    more_results = False
-            except Exception as e:
-                print(f"Failed to send request to OpenSanctions API: {e}")
-                more_results = False
-
-    # Convert all results into a DataFrame
-    if all_results:
-        df = pd.DataFrame(all_results)
-        
-        # Select only the columns of interest
-        df_selected = df[['id', 'caption', 'schema', 'taxNumber', 'innCode']]
-        
-        # Save the results to a CSV file
-        try:
-            df_selected.to_csv(output_path, index=False)
-            print(f"Data saved successfully to {output_path}")
+            
+            # Check if the request was successful (or was answered from the cache)
+            if data is not None:
+                total = (data.get('total') or {}).get('value')
+                results = data.get('results', [])
+                return process_results(results), len(results), total
+            if response is not None:
+                print(f"Error: {response.status_code} - {response.text}")
         except Exception as e:
-            print(f"Error saving file: {e}")
+            print(f"Failed to send request to OpenSanctions API: {e}")
+        return None
+
+    def next_offsets(offset, page_size, total):
+        """Decide which pages to request after the page at `offset` has arrived."""
+        # If the results are less than the batch size, stop pagination
+        if page_size < batch_size:
+            return []
+        # The first page tells us the total, so fan out all remaining pages at once
+        if offset == 0 and total is not None:
+            return list(range(batch_size, total, batch_size))
+        # Without a total, walk the pages one after another
+        if total is None:
+            return [offset + batch_size]
+        return []
+
+    def process_results(results):
+        """Drop excluded entities and project the rest to EntityRecords."""
+        # Skip excluded entities
+        kept = [project_result(result) for result in results
+                if not exclude_matcher.search(result.get('caption', ''))]
+        metrics.count_rows('opensanctions', rows_in=len(results), rows_out=len(kept))
+        return kept
+
+    keywords = list(dict.fromkeys(keywords))
+
+    # For ordered output: offsets requested per keyword (ascending) and pages held until their turn
+    requested = {keyword: deque([0]) for keyword in keywords}
+    arrived = {}
+    head = 0
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        pending = {}
+        for keyword in keywords:
+            print(f"Searching for keyword: {keyword}")
+            pending[executor.submit(fetch_page, keyword, 0)] = (keyword, 0)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                keyword, offset = pending.pop(future)
+                page = future.result()
+                if page is None:
+                    if ordered:
+                        arrived[(keyword, offset)] = None  # Skipped, so later pages are not held back
+                    continue
+                records, page_size, total = page
+
+                # If no results are returned
+                if offset == 0 and not page_size:
+                    print(f"No results found for keyword: {keyword}")
+
+                for next_offset in next_offsets(offset, page_size, total):
+                    pending[executor.submit(fetch_page, keyword, next_offset)] = (keyword, next_offset)
+                    requested[keyword].append(next_offset)
+
+                if ordered:
+                    arrived[(keyword, offset)] = records
+                else:
+                    yield keyword, offset, records
+
+            # Release every page whose earlier pages have all been released
+            while ordered and head < len(keywords):
+                keyword = keywords[head]
+                offsets = requested[keyword]
+                if not offsets:
+                    head += 1
+                elif (keyword, offsets[0]) in arrived:
+                    offset = offsets.popleft()
+                    records = arrived.pop((keyword, offset))
+                    if records is not None:
+                        yield keyword, offset, records
+                else:
+                    break
+
+def run_opensanctions(api_key, output_path, additional_keywords=None, max_in_flight=8, session=None, cache=None,
+                      flush_rows=5000):
+    """Run the OpenSanctions data fetch with user-specified keywords.
+
+    All keywords are paged through concurrently over a pooled keep-alive session,
+    with at most `max_in_flight` requests outstanding at any time. Pages already
+    in the optional response `cache` are served without a network call.
+
+    Records are written to `<output_path>.partial` in the order their pages
+    arrive and flushed every `flush_rows` rows, so memory use does not grow with
+    the number of results. The finished file replaces `output_path`, so a failed
+    run never leaves a truncated output behind.
+    """
+    
+    print("Running OpenSanctions with the following output path:", output_path)
+    
+    keywords = combine_keywords(additional_keywords)
+
+    partial_path = output_path + '.partial'
+    written = unflushed = 0
+    with open(partial_path, 'w', newline='', encoding='utf-8', buffering=1024 * 1024) as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(ENTITY_COLUMNS)
+
+        # Nothing downstream depends on row order, so no page is held back waiting for its turn
+        for _, _, records in iter_opensanctions_pages(api_key, keywords, max_in_flight, session, cache):
+            writer.writerows(records)
+            written += len(records)
+            unflushed += len(records)
+            if unflushed >= flush_rows:
+                f.flush()
+                unflushed = 0
+
+    if written:
+        os.replace(partial_path, output_path)
+        print(f"Data saved successfully to {output_path} ({written} entities)")
     else:
+        os.remove(partial_path)
         print("No results found.")
 
 # The main block for standalone testing (optional)
@@ -0,0 +1,263 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
+import pandas as pd
+from src import metrics
+from src.OpenSanctionsv2 import combine_keywords, iter_opensanctions_pages
+from src.bulkingest import OUTPUT_COLUMNS as ENTITY_COLUMNS, run_bulk_opensanctions
+from src.cache import ResponseCache
+from src.cleaningscriptv2 import run_cleaning
+from src.clearspendingv5 import (OUTPUT_COLUMNS as SUPPLIER_COLUMNS, START_DATE, END_DATE, aggregate_top_suppliers,
+                                 iter_contracts)
+from src.datamerge import run_merge
+from src.final_clean import deduplicate, run_final_clean
+from src.keyscheduler import KeyScheduler, KeyPoolExhausted, RateLimitExceeded
+from src.session import make_session
+from src.store import export_sections, read_store, write_store
+from src.translate import TranslationMemo, make_translate_client, run_translation, translate_names
+
+# Settings every job inherits unless it overrides them (or the config's "defaults" do)
+JOB_DEFAULTS = {
+    'keywords': [],
+    'bulk_file': None,
+    'start_date': START_DATE,
+    'end_date': END_DATE,
+    'top_k': 3,
+    'resolve': True,
+    'translate': True,
+}
+
+def load_batch_config(path):
+    """Read a batch config file (JSON) and check that it lists uniquely named jobs.
+
+    Example:
+        {
+          "output_dir": "output/nightly",
+          "workers": 6,
+          "defaults": {"start_date": "2014-07-31", "end_date": "2022-02-23"},
+          "jobs": [
+            {"name": "military", "keywords": ["tank production"]},
+            {"name": "drones", "keywords": ["drones", "UAV"], "start_date": "2022-02-24", "end_date": "2024-12-31"}
+          ]
+        }
+
+    API keys can be given as "opensanctions_api_key", "clearspending_api_keys"
+    and "google_credentials", or through the OPENSANCTIONS_API_KEY,
+    CLEARSPENDING_API_KEYS (comma-separated) and GOOGLE_APPLICATION_CREDENTIALS
+    environment variables, which keeps them out of the file.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    jobs = config.get('jobs')
+    if not jobs:
+        raise ValueError(f"Batch config {path} lists no jobs.")
+    names = [job.get('name') for job in jobs]
+    if not all(names) or len(set(names)) != len(names):
+        raise ValueError(f"Every job in {path} needs a unique name.")
+    config.setdefault('output_dir', os.path.join(os.path.dirname(os.path.abspath(path)), 'output', 'batch'))
+    return config
+
+def resolve_jobs(config):
+    """Fill in every job's settings from JOB_DEFAULTS and the config's defaults."""
+    defaults = dict(JOB_DEFAULTS, **config.get('defaults', {}))
+    jobs = []
+    for job in config['jobs']:
+        job = dict(defaults, **job)
+        job.setdefault('output_dir', os.path.join(config['output_dir'], job['name']))
+        # Same keyword handling as run_opensanctions: the default preset plus the job's own keywords
+        job['keywords'] = list(dict.fromkeys(combine_keywords(job['keywords'])))
+        jobs.append(job)
+    return jobs
+
+def fetch_keyword_results(api_key, keywords, session, cache, max_in_flight=8):
+    """Fetch every keyword once and return {keyword: EntityRecords in page order}."""
+    results = {keyword: [] for keyword in keywords}
+    for keyword, _, records in iter_opensanctions_pages(api_key, keywords, max_in_flight, session, cache, ordered=True):
+        results[keyword].extend(records)
+    return results
+
+def lookup_suppliers(lookups, session, scheduler, cache, max_workers, top_k, max_pages=None):
+    """Find the top suppliers of each distinct (inn, start_date, end_date) lookup once.
+
+    Returns ({lookup: [(supplier_inn, info), ...] or None}, completed). A lookup
+    maps to None when it stayed rate limited, the key pool ran out, or its
+    contracts could not all be fetched.
+    """
+    results = {}
+    completed = True
+
+    def find(lookup):
+        inn, start_date, end_date = lookup
+        status = {}
+        contracts = iter_contracts(session, scheduler, inn, start_date=start_date, end_date=end_date,
+                                   cache=cache, max_pages=max_pages, status=status)
+        suppliers = aggregate_top_suppliers(contracts, top_k=top_k)
+        return suppliers if status['complete'] else None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(find, lookup): lookup for lookup in lookups}
+        for future in as_completed(futures):
+            lookup = futures[future]
+            if future.cancelled():
+                results[lookup] = None
+                continue
+            try:
+                results[lookup] = future.result()
+                if results[lookup] is None:
+                    print(f"Contracts of INN {lookup[0]} were not all fetched. Rerun to retry it.")
+                    completed = False
+            except KeyPoolExhausted as e:
+                print(e)
+                completed = False
+                results[lookup] = None
+                for pending in futures:
+                    pending.cancel()
+            except RateLimitExceeded as e:
+                print(e)
+                completed = False
+                results[lookup] = None
+    return results, completed
+
+def job_paths(job):
+    """Output files of a job, named as in an interactive run."""
+    directory = job['output_dir']
+    return {
+        'opensanctions': os.path.join(directory, "sanctioned_entities_with_inn.csv"),
+        'cleaned': os.path.join(directory, "data_cleaned_finalv2.csv"),
+        'suppliers': os.path.join(directory, "top_3_suppliers_by_companyv2.csv"),
+        'merged': os.path.join(directory, "merged.arrow"),
+        'final': os.path.join(directory, "forImportGenius_no_duplicates.csv"),
+        'store': os.path.join(directory, "entities.arrow"),
+        'translated': os.path.join(directory, "data_request.csv"),
+    }
+
+def write_supplier_rows(job, cleaned, supplier_results, output_file):
+    """Write a job's supplier CSV from the shared lookup results, in input order."""
+    rows = []
+    for caption, inn in zip(cleaned['caption'], cleaned['innCode']):
+        if pd.isna(inn):
+            continue
+        top_suppliers = supplier_results.get((inn, job['start_date'], job['end_date'])) or []
+        for supplier_inn, supplier_info in top_suppliers[:job['top_k']]:
+            rows.append({
+                'Company Name': caption,
+                'Supplier Name': supplier_info['name'],
+                'Supplier INN': supplier_inn,
+                'Total Contract Value': supplier_info['total_value'],
+            })
+    pd.DataFrame(rows, columns=SUPPLIER_COLUMNS).to_csv(output_file, index=False)
+
+def run_batch(config, opensanctions_api_key=None, clearspending_api_keys=None, google_credentials=None,
+              session=None, cache=None, scheduler=None, translate_client=None, memo=None):
+    """Run every job of a batch config in one process.
+
+    The jobs share one HTTP session, response cache, key scheduler and
+    translation memo. Each distinct keyword, supplier lookup (INN and date
+    window) and name is sent to the APIs once for the whole batch, however
+    many jobs contain it, so a batch costs about as much as the union of its
+    queries. Each job gets the same output files as an interactive run, and
+    `combined/` holds the entities of all jobs deduplicated together.
+    Returns {job name: True if the job is complete}.
+    """
+    jobs = resolve_jobs(config)
+    output_dir = config['output_dir']
+    workers = config.get('workers', 4)
+    opensanctions_api_key = (opensanctions_api_key or config.get('opensanctions_api_key')
+                             or os.environ.get('OPENSANCTIONS_API_KEY'))
+    if clearspending_api_keys is None:
+        clearspending_api_keys = config.get('clearspending_api_keys') or [
+            key.strip() for key in os.environ.get('CLEARSPENDING_API_KEYS', '').split(',') if key.strip()]
+    google_credentials = (google_credentials or config.get('google_credentials')
+                          or os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'))
+
+    os.makedirs(output_dir, exist_ok=True)
+    for job in jobs:
+        os.makedirs(job['output_dir'], exist_ok=True)
+
+    # Resources shared by all jobs
+    if scheduler is None:
+        scheduler = KeyScheduler(clearspending_api_keys)
+    if session is None:
+        session = make_session(pool_size=max(workers, 2 * len(scheduler), 8))
+    if cache is None:
+        cache = ResponseCache(os.path.join(output_dir, "http_cache.sqlite"))
+    if memo is None:
+        memo = TranslationMemo(os.path.join(output_dir, "translation_memo.sqlite"))
+    if translate_client is None and google_credentials and any(job['translate'] for job in jobs):
+        translate_client = make_translate_client(google_credentials)
+    paths = {job['name']: job_paths(job) for job in jobs}
+
+    # Step 1: Fetch each distinct keyword once; bulk-export jobs read their file instead
+    search_jobs = [job for job in jobs if not job['bulk_file']]
+    keywords = list(dict.fromkeys(keyword for job in search_jobs for keyword in job['keywords']))
+    print(f"Batch of {len(jobs)} jobs: fetching {len(keywords)} distinct keywords...")
+    with metrics.stage('opensanctions'):
+        keyword_results = fetch_keyword_results(opensanctions_api_key, keywords, session, cache) if keywords else {}
+        for job in jobs:
+            if job['bulk_file']:
+                run_bulk_opensanctions(job['bulk_file'], paths[job['name']]['opensanctions'], job['keywords'])
+            else:
+                records = [record for keyword in job['keywords'] for record in keyword_results[keyword]]
+                pd.DataFrame(records, columns=ENTITY_COLUMNS).to_csv(paths[job['name']]['opensanctions'], index=False)
+
+    # Step 2: Clean each job's entities
+    def clean_job(job):
+        run_cleaning(paths[job['name']]['opensanctions'], paths[job['name']]['cleaned'])
+
+    with metrics.stage('clean'), ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(clean_job, jobs))
+    cleaned = {job['name']: pd.read_csv(paths[job['name']]['cleaned'], dtype={'innCode': 'string'}) for job in jobs}
+
+    # Step 3: Look up the suppliers of each distinct INN and date window once
+    lookups = list(dict.fromkeys(
+        (inn, job['start_date'], job['end_date']) for job in jobs for inn in cleaned[job['name']]['innCode'].dropna()))
+    entity_count = sum(len(cleaned[job['name']]) for job in jobs)
+    print(f"Looking up suppliers for {len(lookups)} distinct companies ({entity_count} across all jobs)...")
+    with metrics.stage('suppliers'):
+        supplier_results, suppliers_complete = lookup_suppliers(
+            lookups, session, scheduler, cache, max_workers=max(workers, 2 * len(scheduler)),
+            top_k=max(job['top_k'] for job in jobs), max_pages=config.get('max_pages'))
+    print(f"Requests sent per API key: {scheduler.usage()}")
+
+    # Step 4: Merge and deduplicate each job
+    def finish_job(job):
+        job_files = paths[job['name']]
+        write_supplier_rows(job, cleaned[job['name']], supplier_results, job_files['suppliers'])
+        run_merge(job_files['cleaned'], job_files['suppliers'], job_files['merged'])
+        run_final_clean(job_files['merged'], job_files['final'], job_files['store'], resolve=job['resolve'])
+
+    with metrics.stage('dedup'), ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(finish_job, jobs))
+
+    # Step 5: Translate the distinct names of all jobs at once, then write each job from the memo
+    translate_jobs = [job for job in jobs if job['translate']]
+    if translate_client is not None and translate_jobs:
+        with metrics.stage('translate'):
+            names = pd.concat([read_store(paths[job['name']]['store'], columns=['caption'])['caption']
+                               for job in translate_jobs])
+            translate_names(translate_client, names, memo=memo, max_workers=workers)
+            for job in translate_jobs:
+                run_translation(paths[job['name']]['final'], paths[job['name']]['translated'],
+                                translate_client=translate_client, memo=memo)
+
+    # Step 6: Entities of all jobs together, each INN once (factories first)
+    combined_dir = os.path.join(output_dir, 'combined')
+    os.makedirs(combined_dir, exist_ok=True)
+    combined = pd.concat([read_store(paths[job['name']]['store']) for job in jobs], ignore_index=True)
+    combined = deduplicate(combined.sort_values('role', kind='stable'))
+    write_store(combined, os.path.join(combined_dir, "entities.arrow"))
+    export_sections(combined, os.path.join(combined_dir, "forImportGenius_no_duplicates.csv"))
+    print(f"Combined {len(combined)} distinct entities from {len(jobs)} jobs into {combined_dir}")
+
+    # A job is complete when none of its own lookups was left unanswered
+    status = {}
+    for job in jobs:
+        inns = cleaned[job['name']]['innCode'].dropna()
+        status[job['name']] = suppliers_complete or all(
+            supplier_results.get((inn, job['start_date'], job['end_date'])) is not None for inn in inns)
+        print(f"Job {job['name']}: {'complete' if status[job['name']] else 'incomplete, rerun to retry'}")
+    return status
+
+def run_batch_file(config_file, **kwargs):
+    """Load a batch config file and run all of its jobs."""
+    return run_batch(load_batch_config(config_file), **kwargs)
@@ -0,0 +1,63 @@
+import csv
+from itertools import islice
+from src import metrics
+from src.entities import OUTPUT_COLUMNS, entity_text, is_sanctioned_ru_entity, iter_entities, project_entity
+from src.OpenSanctionsv2 import EXCLUDE_KEYWORDS
+from src.matcher import KeywordMatcher
+
+def iter_bulk_records(path, keywords=None):
+    """Generator pipeline: read entities, keep sanctioned Russian legal entities and project them."""
+    exclude_matcher = KeywordMatcher(EXCLUDE_KEYWORDS)
+    include_matcher = KeywordMatcher(keywords) if keywords else None
+    read = kept = 0
+    try:
+        for entity in iter_entities(path):
+            read += 1
+            if not is_sanctioned_ru_entity(entity):
+                continue
+
+            # Skip excluded entities
+            if exclude_matcher.search(entity.get('caption', '')):
+                continue
+
+            if include_matcher and not include_matcher.search(entity_text(entity)):
+                continue
+            kept += 1
+            yield project_entity(entity)
+    finally:
+        metrics.count_rows('opensanctions', rows_in=read, rows_out=kept)
+
+def write_records_csv(records, output_path, batch_size=1000):
+    """Write projected records to the output CSV in batches. Returns the number written."""
+    written = 0
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_COLUMNS)
+        writer.writeheader()
+        records = iter(records)
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            writer.writerows(batch)
+            written += len(batch)
+    return written
+
+def run_bulk_opensanctions(bulk_file, output_path, keywords=None, batch_size=1000):
+    """Build the OpenSanctions output CSV from a local bulk FtM export instead of the search API.
+
+    The export is streamed line by line and matching records are written in
+    batches of `batch_size`, so memory use does not depend on the file size.
+    Without `keywords` every sanctioned Russian legal entity is kept.
+    """
+    print(f"Reading OpenSanctions bulk export: {bulk_file}")
+    written = write_records_csv(iter_bulk_records(bulk_file, keywords), output_path, batch_size)
+    if written:
+        print(f"Data saved successfully to {output_path} ({written} entities)")
+    else:
+        print("No results found.")
+
+def run_index_opensanctions(index, output_path, keywords):
+    """Answer a keyword preset from a local EntityIndex and write the OpenSanctions output CSV."""
+    records = index.query_preset(keywords, exclude_keywords=EXCLUDE_KEYWORDS)
+    written = write_records_csv(records, output_path)
+    print(f"Local index matched {written} of {len(index)} entities; saved to {output_path}")
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from src import metrics
+
+# How long a cached response stays fresh, per endpoint (matched against the URL)
+DEFAULT_TTLS = {
+    'search/sanctions': 7 * 24 * 3600,     # Sanctions lists change weekly at most
+    'filtered-contracts': 30 * 24 * 3600,  # Historical contracts rarely change
+    'match': 7 * 24 * 3600,                # Screening follows the sanctions lists
+}
+DEFAULT_TTL = 24 * 3600
+
+# Query parameters that carry credentials and must never be part of a cache key
+SECRET_PARAMS = {'apikey', 'api_key', 'key', 'token'}
+
+class ResponseCache:
+    """Persistent, content-addressed cache of JSON API responses stored in SQLite.
+
+    Entries are keyed by endpoint plus normalized query parameters (credentials
+    are left out), expire after a per-endpoint TTL and are evicted least recently
+    used first once the cache grows past `max_bytes`. In `offline` mode nothing is
+    ever fetched: stale entries are served and misses are reported to the caller.
+    """
+
+    def __init__(self, path, ttls=None, max_bytes=512 * 1024 * 1024, offline=False):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, endpoint TEXT, created REAL, accessed REAL, size INTEGER, body BLOB)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self._conn.commit()
+        self._size = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def make_key(self, url, params=None):
+        """Build a stable cache key from the endpoint and its normalized parameters."""
+        normalized = sorted(
+            (str(name), str(value).strip())
+            for name, value in (params or {}).items()
+            if value is not None and name.lower() not in SECRET_PARAMS
+        )
+        raw = json.dumps([url.rstrip('/'), normalized], ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def ttl_for(self, url):
+        """Return the TTL in seconds for the endpoint behind `url`."""
+        for endpoint, ttl in self.ttls.items():
+            if endpoint in url:
+                return ttl
+        return DEFAULT_TTL
+
+    def get(self, url, params=None):
+        """Return the cached JSON payload for a request, or None if missing or expired."""
+        key = self.make_key(url, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT created, body FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or (not self.offline and now - row[0] > self.ttl_for(url)):
+                self.misses += 1
+                metrics.observe_cache(url, hit=False)
+                return None
+            self._conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+            self.hits += 1
+        metrics.observe_cache(url, hit=True)
+        return json.loads(zlib.decompress(row[1]).decode('utf-8'))
+
+    def set(self, url, params, payload):
+        """Store a JSON payload for a request and evict old entries if over the size limit."""
+        key = self.make_key(url, params)
+        body = zlib.compress(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, endpoint, created, accessed, size, body) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, url, now, now, len(body), body)
+            )
+            self._size += len(body) - (old[0] if old else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in `max_bytes`."""
+        while self._size > self.max_bytes:
+            rows = self._conn.execute('SELECT key, size FROM responses ORDER BY accessed LIMIT 100').fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._size -= size
+                if self._size <= self.max_bytes:
+                    break
+
+    def iter_payloads(self, endpoint):
+        """Yield every cached payload whose URL contains `endpoint`, regardless of age."""
+        with self._lock:
+            rows = self._conn.execute('SELECT body FROM responses WHERE endpoint LIKE ?', (f'%{endpoint}%',)).fetchall()
+        for (body,) in rows:
+            yield json.loads(zlib.decompress(body).decode('utf-8'))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def cached_get_json(session, url, params=None, headers=None, cache=None, **kwargs):
+    """GET a JSON endpoint through the response cache.
+
+    Returns (data, response). `data` is the decoded JSON of a successful response
+    (from the cache or the network) and None otherwise. `response` is the live
+    response object, or None when no request was sent (cache hit or offline miss).
+    """
+    if cache is not None:
+        data = cache.get(url, params)
+        if data is not None:
+            return data, None
+        if cache.offline:
+            print(f"Cache-only mode: no cached response for {url}")
+            return None, None
+
+    start = time.perf_counter()
+    try:
+        response = session.get(url, params=params, headers=headers, **kwargs)
+    except Exception:
+        metrics.observe_request(url, 'error', time.perf_counter() - start)
+        raise
+    metrics.observe_request(url, response.status_code, time.perf_counter() - start)
+    if response.status_code != 200:
+        return None, response
+
+    data = response.json()
+    if cache is not None:
+        cache.set(url, params, data)
+    return data, response
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import threading
+from src import metrics
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """Return the SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def fingerprint(inputs=(), params=None):
+    """Hash the contents of the input files together with the stage parameters."""
+    digest = hashlib.sha256()
+    for path in inputs:
+        digest.update(path.encode('utf-8'))
+        digest.update(file_hash(path).encode('ascii') if os.path.exists(path) else b'missing')
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+class Manifest:
+    """Records, per pipeline stage, the fingerprint of the inputs it last completed with.
+
+    The manifest is a JSON file in the output directory. A stage whose inputs and
+    parameters are unchanged, and whose outputs still exist, does not need to run
+    again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.stages = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.stages = json.load(f)
+
+    def is_complete(self, stage, inputs=(), outputs=(), params=None):
+        entry = self.stages.get(stage)
+        if entry is None or not all(os.path.exists(path) for path in outputs):
+            return False
+        return entry['fingerprint'] == fingerprint(inputs, params)
+
+    def mark_complete(self, stage, inputs=(), outputs=(), params=None):
+        self.stages[stage] = {
+            'fingerprint': fingerprint(inputs, params),
+            'outputs': {path: file_hash(path) for path in outputs if os.path.exists(path)},
+        }
+        self.save()
+
+    def save(self):
+        # Write to a temporary file first so an interrupted save never corrupts the manifest
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.stages, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+def run_stage(manifest, stage, func, inputs=(), outputs=(), params=None, force=False):
+    """Run a stage unless the manifest shows it already completed with the same inputs (or `force` is set).
+
+    A stage function may return False to say it stopped early; its outputs are
+    kept but the stage is not marked complete, so the next run resumes it.
+    Returns True when the stage completed and all of its outputs exist.
+    """
+    if not force and manifest is not None and manifest.is_complete(stage, inputs, outputs, params):
+        print(f"Skipping {stage}: inputs unchanged since the last completed run.")
+        return True
+
+    with metrics.stage(stage):
+        completed = func()
+
+    if not all(os.path.exists(path) for path in outputs):
+        return False
+    if completed is False:
+        return False
+    if manifest is not None:
+        manifest.mark_complete(stage, inputs, outputs, params)
+    return True
+
+class Progress:
+    """Append-only cursor of the entities a stage has already finished.
+
+    The first line of the file holds the fingerprint of the stage's inputs; if the
+    inputs change, the recorded progress is discarded and the stage starts over.
+    """
+
+    def __init__(self, path, input_fingerprint):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+
+        resumed = False
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            if lines and lines[0] == input_fingerprint:
+                self.done.update(lines[1:])
+                resumed = True
+
+        self.resumed = resumed
+        if not resumed:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(input_fingerprint + '\n')
+
+    def __contains__(self, key):
+        return str(key) in self.done
+
+    def __len__(self):
+        return len(self.done)
+
+    def mark(self, key):
+        """Record that the entity `key` has been completed."""
+        with self._lock:
+            self.done.add(str(key))
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(f"{key}\n")
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -1,40 +1,103 @@
+import numpy as np
 import pandas as pd
-import re
-
-def run_cleaning(input_file, output_file):
-    """Clean the CSV data."""
-    
-    # Load the CSV file
-    df = pd.read_csv(input_file)
-    
-    # Step 1: Remove rows where there are duplicate innCodes
-    df.drop_duplicates(subset='innCode', inplace=True)
-
-    # Step 2: Remove rows where the 'schema' column has the value 'person'
-    df = df[df['schema'].str.lower() != 'person']
-
-    # Step 3: Handle missing innCodes by looking at the taxNumber column
-    # Assuming the INN code format is numeric with a length of 10 digits (modify as needed)
-    inn_code_pattern = re.compile(r'^\d{10}$')
-
-    def check_inn_format(value):
-        """Check if the value matches the INN code format."""
-        if pd.isna(value):
-            return False
-        return bool(inn_code_pattern.match(str(value)))
-
-    # Iterate over rows and fill innCode where it's missing
-    for index, row in df.iterrows():
-        if pd.isna(row['innCode']):  # If innCode is missing
-            tax_number = row['taxNumber']
-            if check_inn_format(tax_number):
-                df.at[index, 'innCode'] = tax_number  # Move taxNumber to innCode
-            else:
-                df.at[index, 'innCode'] = None  # Leave blank if format doesn't match
-
-    # Step 4: Drop the taxNumber column
-    df.drop(columns=['taxNumber'], inplace=True)
-
-    # Step 5: Save the cleaned dataframe to a new CSV file
-    df.to_csv(output_file, index=False)
-    print(f"Cleaned data saved to {output_file}")
+from src import metrics
+
+# Checksum weights for Russian INNs (10-digit legal entities, 12-digit individuals)
+INN10_WEIGHTS = np.array([2, 4, 10, 3, 5, 9, 4, 6, 8])
+INN12_WEIGHTS_11 = np.array([7, 2, 4, 10, 3, 5, 9, 4, 6, 8])
+INN12_WEIGHTS_12 = np.array([3, 7, 2, 4, 10, 3, 5, 9, 4, 6, 8])
+
+def _digit_matrix(values, width):
+    """Turn a list of equal-length digit strings into an (n, width) integer matrix."""
+    raw = np.frombuffer(''.join(values).encode('ascii'), dtype=np.uint8)
+    return (raw - ord('0')).reshape(-1, width).astype(np.int64)
+
+def normalize_inn(series):
+    """Return INN values as stripped strings (NA when blank), undoing float artefacts like '7701234567.0'."""
+    inn = series.astype('string').str.strip()
+    inn = inn.str.replace(r'\.0$', '', regex=True)
+    return inn.mask(inn == '')
+
+def valid_inn_mask(series):
+    """Vectorized check that values are well-formed 10- or 12-digit INNs with valid checksums."""
+    inn = normalize_inn(series)
+    mask = pd.Series(False, index=series.index)
+
+    is_10 = inn.str.fullmatch(r'[0-9]{10}').fillna(False).astype(bool)
+    if is_10.any():
+        digits = _digit_matrix(inn[is_10].tolist(), 10)
+        mask[is_10] = (digits[:, :9] @ INN10_WEIGHTS) % 11 % 10 == digits[:, 9]
+
+    is_12 = inn.str.fullmatch(r'[0-9]{12}').fillna(False).astype(bool)
+    if is_12.any():
+        digits = _digit_matrix(inn[is_12].tolist(), 12)
+        check_11 = (digits[:, :10] @ INN12_WEIGHTS_11) % 11 % 10 == digits[:, 10]
+        check_12 = (digits[:, :11] @ INN12_WEIGHTS_12) % 11 % 10 == digits[:, 11]
+        mask[is_12] = check_11 & check_12
+
+    return mask
+
+def clean_chunk(df):
+    """Apply the cleaning rules to one DataFrame (or one chunk of a larger file)."""
+
+    # Remove rows where the 'schema' column has the value 'person'
+    df = df[df['schema'].str.lower() != 'person'].copy()
+
+    # Handle missing innCodes by taking the taxNumber when it is a valid INN
+    df['innCode'] = normalize_inn(df['innCode'])
+    if 'taxNumber' in df.columns:
+        fill = df['innCode'].isna() & valid_inn_mask(df['taxNumber'])
+        df.loc[fill, 'innCode'] = normalize_inn(df.loc[fill, 'taxNumber'])
+
+        # Drop the taxNumber column
+        df.drop(columns=['taxNumber'], inplace=True)
+
+    return df
+
+def drop_seen(df, seen_inns, seen_ids):
+    """Remove rows whose innCode was already seen, updating the seen sets in place.
+
+    Rows without an INN are deduplicated by id instead.
+    """
+    has_inn = df['innCode'].notna()
+    duplicate = has_inn & (df['innCode'].isin(seen_inns) | df['innCode'].duplicated())
+    if 'id' in df.columns:
+        duplicate |= ~has_inn & (df['id'].isin(seen_ids) | df['id'].duplicated())
+        seen_ids.update(df.loc[~has_inn & ~duplicate, 'id'])
+    df = df[~duplicate]
+    seen_inns.update(df.loc[df['innCode'].notna(), 'innCode'])
+    return df
+
+def run_cleaning(input_file, output_file, chunksize=None):
+    """Clean the CSV data.
+
+    With `chunksize` set, the input is streamed in chunks of that many rows and
+    duplicate INNs are tracked across chunks, so memory stays flat however large
+    the input file is.
+    """
+
+    # INNs are identifiers, not numbers: read them as strings to keep leading zeros
+    read_options = {'dtype': {'innCode': 'string', 'taxNumber': 'string'}}
+    if chunksize is None:
+        chunks = [pd.read_csv(input_file, **read_options)]
+    else:
+        chunks = pd.read_csv(input_file, chunksize=chunksize, **read_options)
+
+    # Dedup state shared by all chunks
+    seen_inns = set()
+    seen_ids = set()
+    rows_in = 0
+    rows_out = 0
+    first_chunk = True
+
+    for chunk in chunks:
+        rows_in += len(chunk)
+        df = drop_seen(clean_chunk(chunk), seen_inns, seen_ids)
+
+        # Save the cleaned rows to the output CSV file
+        df.to_csv(output_file, index=False, mode='w' if first_chunk else 'a', header=first_chunk)
+        first_chunk = False
+        rows_out += len(df)
+
+    metrics.count_rows('clean', rows_in=rows_in, rows_out=rows_out)
+    print(f"Cleaned data saved to {output_file} ({rows_out} of {rows_in} rows kept)")
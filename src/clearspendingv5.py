@@ -1,106 +1,360 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import csv
+from datetime import date, timedelta
+import heapq
+from itertools import islice
+import os
 import time
 import requests
 import pandas as pd
+from src import metrics
+from src.session import make_session
+from src.keyscheduler import KeyScheduler, KeyPoolExhausted, RateLimitExceeded, parse_retry_after
+from src.checkpoint import Progress, fingerprint
+from src.supplier_store import supplier_totals
 
-def run_clearspending(input_file, output_file, api_keys):
-    """Processes each company and finds the top suppliers by querying the Clearspending API."""
-
-    # API Keys provided by the user
-    current_key_index = 0  # Track the current API key
-
-    def switch_api_key():
-        """Switch to the next API key in the list, cycling through them."""
-        nonlocal current_key_index
-        current_key_index += 1
-        if current_key_index >= len(api_keys):
-            print("All API keys have reached their quota. Please try again later.")
-            raise SystemExit
-        print(f"Switching to API Key #{current_key_index + 1}")
-
-    def query_clearspending(inn=None, page_size=50, start_date=None, end_date=None):
-        """Queries the Clearspending API by INN to find contracts where they are customers within a time frame."""
-        params = {
-            'apikey': api_keys[current_key_index],
-            'page_size': page_size,
-            'sort': '-amount_rur',  # Sort by contract amount in descending order
-            'sign_date_gte': start_date,
-            'sign_date_lte': end_date,
-        }
+CONTRACTS_URL = "https://newapi.clearspending.ru/csinternalapi/v1/filtered-contracts/"
+
+# Default contract window
+START_DATE = '2014-07-31'  # Start of sanctions
+END_DATE = '2022-02-23'    # Invasion of Ukraine
+
+OUTPUT_COLUMNS = ['Company Name', 'Supplier Name', 'Supplier INN', 'Total Contract Value']
+
+def query_clearspending(session, scheduler, inn=None, page_size=50, start_date=None, end_date=None, cache=None, max_attempts=8, page=1):
+    """Queries the Clearspending API by INN to find contracts where they are customers within a time frame.
+
+    Returns the result page (with a count of 0 when there are no contracts), or
+    None when the page could not be fetched.
+    """
+    if not inn:
+        return None
+
+    params = {
+        'page': page,
+        'page_size': page_size,
+        'sort': '-amount_rur',  # Sort by contract amount in descending order
+        'sign_date_gte': start_date,
+        'sign_date_lte': end_date,
+        'customer_inn': inn,  # Query by customer INN
+    }
+    print(f"Searching by Customer INN: {inn} (page {page})")
+
+    # Answer from the cache when possible so no key or rate budget is spent
+    result = None
+    if cache is not None:
+        result = cache.get(CONTRACTS_URL, params)
+        if result is None and cache.offline:
+            print(f"Cache-only mode: no cached contracts for INN {inn}")
+            return None
+
+    attempt = 0
+    rate_limited = False
+    while result is None and attempt < max_attempts:
+        attempt += 1
+        key_index = scheduler.acquire()
+        key_label = f'clearspending-{key_index + 1}'
+        start = time.perf_counter()
         try:
-            if inn:
-                print(f"Searching by Customer INN: {inn}")
-                params['customer_inn'] = inn  # Query by customer INN
-                response = requests.get(f"https://newapi.clearspending.ru/csinternalapi/v1/filtered-contracts/", params=params)
-                
-                if response.status_code == 429:  # Handle rate limit exceeded (429)
-                    print(f"Rate limit exceeded for API Key #{current_key_index + 1}.")
-                    switch_api_key()
-                    time.sleep(5)  # Wait before retrying with a new key
-                    return query_clearspending(inn, page_size, start_date, end_date)
-
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get('count', 0) > 0:
-                        return result
-                    print("No results found with Customer INN.")
-                else:
-                    print(f"INN search failed: {response.status_code} - {response.text}")
+            response = session.get(CONTRACTS_URL, params=dict(params, apikey=scheduler.key(key_index)))
         except requests.exceptions.RequestException as e:
+            metrics.observe_request(CONTRACTS_URL, 'error', time.perf_counter() - start, key=key_label)
             print(f"Error querying the API: {e}")
+            rate_limited = False
+            if attempt < max_attempts:
+                time.sleep(scheduler.retry_delay(attempt))
+            continue
+        metrics.observe_request(CONTRACTS_URL, response.status_code, time.perf_counter() - start, key=key_label)
+
+        if response.status_code == 429:  # Handle rate limit exceeded (429)
+            rate_limited = True
+            scheduler.report_rate_limited(key_index, parse_retry_after(response.headers.get('Retry-After')))
+            continue
+        rate_limited = False
+
+        if response.status_code >= 500:
+            # A server hiccup says nothing about the key's rate: wait and send the same page again
+            print(f"INN search failed: {response.status_code} - {response.text}")
+            if attempt < max_attempts:
+                time.sleep(scheduler.retry_delay(attempt))
+            continue
+        if response.status_code != 200:
+            print(f"INN search failed: {response.status_code} - {response.text}")
+            return None
+
+        scheduler.report_success(key_index)
+        result = response.json()
+        if cache is not None:
+            cache.set(CONTRACTS_URL, params, result)
+
+    if result is None:
+        if rate_limited:
+            raise RateLimitExceeded(f"Giving up on INN {inn} after {max_attempts} rate-limited attempts.")
+        print(f"Giving up on INN {inn} (page {page}) after {max_attempts} failed attempts.")
         return None
+    if result.get('count', 0) == 0:
+        print("No results found with Customer INN.")
+    return result
+
+def iter_contracts(session, scheduler, inn, start_date=None, end_date=None, cache=None, page_size=50, max_pages=None,
+                   status=None):
+    """Yields every contract where `inn` is the customer, fetching one page at a time.
+
+    When a `status` dict is given, status['complete'] is set once the stream
+    ends: False if a page could not be fetched or `max_pages` cut it short.
+    """
+    if status is None:
+        status = {}
+    status['complete'] = not inn  # Without an INN there is nothing to fetch
+    page = 1
+    fetched = 0
+    while True:
+        result = query_clearspending(session, scheduler, inn=inn, page_size=page_size, start_date=start_date,
+                                     end_date=end_date, cache=cache, page=page)
+        if result is None:
+            return
+        contracts = result.get('data', [])
+        yield from contracts
+
+        fetched += len(contracts)
+        if len(contracts) < page_size or fetched >= result.get('count', 0):
+            status['complete'] = True
+            return
+        if max_pages is not None and page >= max_pages:
+            print(f"Stopping INN {inn} after {max_pages} pages ({fetched} of {result.get('count')} contracts).")
+            return
+        page += 1
+
+def aggregate_top_suppliers(contracts, top_k=3):
+    """Totals contract value per supplier over a contract stream and returns the `top_k` largest.
+
+    Only one running total per distinct supplier is kept, never the contracts
+    themselves. Returns a list of (supplier_inn, {'name': ..., 'total_value': ...}).
+    """
+    return heapq.nlargest(top_k, supplier_totals(contracts).items(), key=lambda x: x[1]['total_value'])
+
+def split_date_range(start_date, end_date, months=None):
+    """Splits the window `start_date`..`end_date` (ISO dates, inclusive) into consecutive sub-ranges.
+
+    Sub-ranges end on calendar boundaries every `months` months (12 = calendar
+    years), so those of closed periods stay identical from one run to the next
+    and their cached responses keep being reused as the window grows.
+    """
+    if not months:
+        return [(start_date, end_date)]
+    start = date.fromisoformat(start_date)
+    end = date.fromisoformat(end_date)
+    ranges = []
+    while start <= end:
+        next_month = ((start.year * 12 + start.month - 1) // months + 1) * months
+        boundary = date(next_month // 12, next_month % 12 + 1, 1)
+        ranges.append((start.isoformat(), min(end, boundary - timedelta(days=1)).isoformat()))
+        start = boundary
+    return ranges
+
+def sync_company_contracts(session, scheduler, inn, store, start_date, end_date, cache=None, window_months=None,
+                           overlap_days=7, max_pages=None, merge_batch=1000):
+    """Brings the stored supplier totals of `inn` up to `end_date`, fetching only what the store has not seen.
+
+    The first sync fetches the whole window. Later ones start `overlap_days`
+    before the INN's watermark, to pick up contracts published some days after
+    they were signed; contracts already counted are skipped. A window that starts
+    elsewhere or ends before the watermark is fetched again from scratch. With
+    `window_months`, the range is split into sub-ranges fetched in parallel.
+    The watermark only moves when every sub-range was fetched in full, so
+    contracts missed by a failed page or a `max_pages` cut-off are fetched again
+    by the next sync. Returns (new contracts merged into the store, whether
+    every contract of the window was fetched).
+    """
+    end_date = min(end_date, date.today().isoformat())
+    fetch_from = start_date
+    watermark = store.watermark(inn)
+    if watermark is not None:
+        stored_start, synced_through = watermark
+        if stored_start != start_date or synced_through > end_date:
+            store.reset(inn)
+        elif synced_through == end_date:
+            return 0, True
+        else:
+            fetch_from = max(start_date, (date.fromisoformat(synced_through) - timedelta(days=overlap_days)).isoformat())
 
-    def process_data_and_find_suppliers(data, start_date, end_date):
-        """Processes each company and finds the top suppliers by querying the Clearspending API."""
-        output_data = []
-        for index, row in data.iterrows():
-            caption = row['caption']
-            print(f"\n--- Searching for company: {caption} (Index {index}) ---")
-            inn_code = str(int(row['innCode'])) if not pd.isnull(row['innCode']) else None
-
-            # Query API for contracts where the entity is a customer
-            result = query_clearspending(inn=inn_code, start_date=start_date, end_date=end_date)
-            if result:
-                contracts = result.get('data', [])
-                suppliers = {}
-                for contract in contracts:
-                    for supplier_inn, supplier_name, amount in zip(
-                        contract.get('supplier_inns', []),
-                        contract.get('supplier_names', []),
-                        [contract.get('amount_rur')] * len(contract.get('supplier_inns', []))
-                    ):
-                        if supplier_inn not in suppliers:
-                            suppliers[supplier_inn] = {'name': supplier_name, 'total_value': amount}
-                        else:
-                            suppliers[supplier_inn]['total_value'] += amount
-
-                # Sort suppliers by total_value and take the top 3
-                top_suppliers = sorted(suppliers.items(), key=lambda x: x[1]['total_value'], reverse=True)[:3]
-
-                # Add the top suppliers to the output data
-                for supplier_inn, supplier_info in top_suppliers:
-                    output_data.append({
-                        'Company Name': caption,
-                        'Supplier Name': supplier_info['name'],
-                        'Supplier INN': supplier_inn,
-                        'Total Contract Value': supplier_info['total_value']
-                    })
-            else:
-                print(f"No results found for company: {caption}")
-
-            time.sleep(5)  # Respect a 5-second delay between API requests to avoid overwhelming the API
-        return output_data
-
-    # Load the input data
-    data = pd.read_csv(input_file)
-
-    # Define the time frame (these can be passed dynamically if needed)
-    start_date = '2014-07-31'  # Start of sanctions
-    end_date = '2022-02-23'    # Invasion of Ukraine
-
-    # Process the data to find the top 3 suppliers for each company
-    output_data = process_data_and_find_suppliers(data, start_date=start_date, end_date=end_date)
-
-    # Save the output data to a CSV file
-    output_df = pd.DataFrame(output_data)
+    def fetch(window):
+        """Merge one sub-range into the store; returns (contracts merged, whether the sub-range is complete)."""
+        status = {}
+        contracts = iter_contracts(session, scheduler, inn, start_date=window[0], end_date=window[1], cache=cache,
+                                   max_pages=max_pages, status=status)
+        merged = 0
+        while True:
+            batch = list(islice(contracts, merge_batch))
+            if not batch:
+                return merged, status['complete']
+            merged += store.merge(inn, batch)
+
+    windows = split_date_range(fetch_from, end_date, window_months)
+    if len(windows) == 1:
+        results = [fetch(windows[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(windows), 4)) as executor:
+            results = list(executor.map(fetch, windows))
+    merged = sum(count for count, _ in results)
+    metrics.add('contracts_merged', merged)
+
+    # Only move the watermark once every sub-range has been merged in full
+    complete = all(window_complete for _, window_complete in results)
+    if complete:
+        store.set_watermark(inn, start_date, end_date)
+    else:
+        print(f"Not every contract of INN {inn} was fetched; its watermark was not moved.")
+    return merged, complete
+
+def find_company_suppliers(session, scheduler, caption, inn, start_date, end_date, cache=None, top_k=3, max_pages=None,
+                           store=None, window_months=None):
+    """Finds the `top_k` suppliers of one company and returns (output rows, complete).
+
+    With a SupplierStore, only contracts newer than the company's watermark are
+    fetched and the top suppliers come from the stored totals. `complete` is
+    False when a page could not be fetched or `max_pages` cut the contracts
+    short, so the rows only reflect part of the company's contracts.
+    """
+    if store is not None and inn:
+        _, complete = sync_company_contracts(session, scheduler, inn, store, start_date, end_date, cache=cache,
+                                             window_months=window_months, max_pages=max_pages)
+        top_suppliers = store.top_suppliers(inn, top_k)
+    else:
+        # Stream all contracts where the entity is a customer and keep the top suppliers
+        status = {}
+        contracts = iter_contracts(session, scheduler, inn, start_date=start_date, end_date=end_date,
+                                   cache=cache, max_pages=max_pages, status=status)
+        top_suppliers = aggregate_top_suppliers(contracts, top_k=top_k)
+        complete = status['complete']
+
+    # Add the top suppliers to the output data
+    company_rows = []
+    for supplier_inn, supplier_info in top_suppliers:
+        company_rows.append({
+            'Company Name': caption,
+            'Supplier Name': supplier_info['name'],
+            'Supplier INN': supplier_inn,
+            'Total Contract Value': supplier_info['total_value']
+        })
+    if not company_rows and complete:
+        print(f"No results found for company: {caption}")
+    return company_rows, complete
+
+def run_clearspending(input_file, output_file, api_keys, cache=None, session=None, scheduler=None, max_workers=None,
+                      top_k=3, max_pages=None, start_date=START_DATE, end_date=END_DATE, store=None,
+                      window_months=None, row_column=None):
+    """Processes each company and finds the top suppliers by querying the Clearspending API.
+
+    Companies are processed concurrently; every API key in `api_keys` is used in
+    parallel through a KeyScheduler that paces each key to the limits the server
+    actually enforces. All contract pages of a company are streamed (up to
+    `max_pages`) and its `top_k` suppliers by total contract value are kept.
+
+    Contracts signed between `start_date` and `end_date` count. With a
+    SupplierStore, supplier totals persist across runs and each company only
+    fetches the contracts signed since its last sync (see sync_company_contracts),
+    so a periodic refresh costs about one request per company plus its new contracts.
+
+    `row_column` names an input column holding each company's row number in a
+    larger input (see src/sharding.py); output rows are then ordered by it and
+    keep it, so shard outputs can be merged back in the original order.
+
+    Results are appended to `<output_file>.partial` as each company finishes and
+    the company is recorded in `<output_file>.progress`, so an interrupted run
+    resumes from where it stopped. Returns True once every company is done.
+    """
+
+    if scheduler is None:
+        scheduler = KeyScheduler(api_keys)
+    if max_workers is None:
+        max_workers = 2 * len(scheduler)
+    if session is None:
+        session = make_session(pool_size=max_workers)
+
+    def find_suppliers(index, row, start_date, end_date):
+        """Finds the top suppliers of a single company."""
+        caption = row['caption']
+        print(f"\n--- Searching for company: {caption} (Index {index}) ---")
+        inn_code = row['innCode'] if not pd.isnull(row['innCode']) else None
+        return find_company_suppliers(session, scheduler, caption, inn_code, start_date, end_date,
+                                      cache=cache, top_k=top_k, max_pages=max_pages, store=store,
+                                      window_months=window_months)
+
+    def process_data_and_find_suppliers(data, start_date, end_date, progress, partial_file):
+        """Processes each company not yet in `progress`, appending its suppliers to `partial_file`."""
+        todo = [(index, row) for index, row in data.iterrows() if index not in progress]
+        if progress.resumed:
+            print(f"Resuming: {len(progress)} companies already done, {len(todo)} left.")
+
+        completed = True
+        write_header = not os.path.exists(partial_file)
+        with open(partial_file, 'a', newline='', encoding='utf-8') as f, \
+                ThreadPoolExecutor(max_workers=max_workers) as executor:
+            writer = csv.DictWriter(f, fieldnames=['_row'] + OUTPUT_COLUMNS)
+            if write_header:
+                writer.writeheader()
+
+            futures = {executor.submit(find_suppliers, index, row, start_date, end_date): index for index, row in todo}
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                try:
+                    company_rows, complete = future.result()
+                except KeyPoolExhausted as e:
+                    # Keep what was found so far; the next run picks up the remaining companies
+                    print(e)
+                    completed = False
+                    for pending in futures:
+                        pending.cancel()
+                    continue
+                except RateLimitExceeded as e:
+                    # Leave the company out of the progress file so the next run retries it
+                    print(e)
+                    completed = False
+                    continue
+
+                index = futures[future]
+                if not complete:
+                    # Partial totals are not written; leave the company out of the progress file so the next run retries it
+                    print(f"Contracts of company at index {index} were not all fetched. Rerun to retry it.")
+                    completed = False
+                    continue
+                writer.writerows(dict(row, _row=index) for row in company_rows)
+                f.flush()
+                metrics.count_rows('suppliers', rows_in=1, rows_out=len(company_rows))
+                progress.mark(index)
+        return completed
+
+    # Load the input data (INNs as strings to keep leading zeros)
+    data = pd.read_csv(input_file, dtype={'innCode': 'string'})
+    if row_column:
+        data = data.set_index(row_column)
+
+    # Resume from an earlier interrupted run over the same input, if there is one
+    partial_file = output_file + '.partial'
+    progress = Progress(output_file + '.progress', fingerprint(
+        [input_file], {'start_date': start_date, 'end_date': end_date, 'top_k': top_k, 'max_pages': max_pages}))
+    if not progress.resumed and os.path.exists(partial_file):
+        os.remove(partial_file)
+
+    # Process the data to find the top suppliers for each company
+    completed = process_data_and_find_suppliers(data, start_date, end_date, progress, partial_file)
+
+    # Save the output data to a CSV file, in input order
+    output_df = pd.read_csv(partial_file, dtype={'Supplier INN': 'string'})
+    output_df = output_df.sort_values('_row', kind='stable')
+    if row_column:
+        output_df = output_df.rename(columns={'_row': row_column})[[row_column] + OUTPUT_COLUMNS]
+    else:
+        output_df = output_df.drop(columns=['_row'])
     output_df.to_csv(output_file, index=False)
     print(f"Data saved to {output_file}")
+    print(f"Requests sent per API key: {scheduler.usage()}")
+
+    if completed:
+        os.remove(partial_file)
+        progress.remove()
+    else:
+        print(f"Run incomplete: {len(progress)} of {len(data)} companies done. Rerun to continue.")
+    return completed
@@ -1,34 +1,57 @@
 import pandas as pd
+from src import metrics
+from src.sharding import iter_merged_rows, shard_header
+from src.store import make_store_frame, write_store_batches
 
-def run_merge(factories_file, suppliers_file, output_file):
-    """Merge factories and suppliers data into one CSV file."""
-
-    # Load the two CSV files
-    df_factories = pd.read_csv(factories_file)
-    df_suppliers = pd.read_csv(suppliers_file)
-
-    # Step 1: Prepare the supplier data for merging
-    df_suppliers_selected = df_suppliers[['Supplier Name', 'Supplier INN']].copy()
-    df_suppliers_selected.rename(columns={'Supplier Name': 'caption', 'Supplier INN': 'innCode'}, inplace=True)
-
-    # Step 2: Remove unnecessary columns from the factories data
-    df_factories.drop(columns=['schema'], inplace=True, errors='ignore')
-    df_factories.drop(columns=['id'], inplace=True, errors='ignore')
-
-    # Step 3: Write the merged output to the specified file
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        # Write the 'factories' header
-        f.write('**factories**\n')
-        f.write(','.join(df_factories.columns) + '\n')
-        
-        for row in df_factories.to_dict(orient='records'):
-            f.write(','.join([str(row[col]) for col in df_factories.columns]) + '\n')
-
-        # Add a newline and 'suppliers' header
-        f.write('\n**suppliers**\n')
-        f.write(','.join(df_factories.columns) + '\n')
-        
-        for row in df_suppliers_selected.to_dict(orient='records'):
-            f.write(','.join([str(row[col]) for col in df_suppliers_selected.columns]) + '\n')
-
-    print(f"Merged file created successfully at {output_file}")
+def iter_supplier_frames(suppliers_file, chunksize):
+    """Yield supplier store frames from the (screened) suppliers CSV or, given a list, from its shard outputs."""
+    if isinstance(suppliers_file, (list, tuple)):
+        # Shard outputs: stream a k-way merge of them back into input order
+        header = shard_header(suppliers_file[0])
+        name, inn = header.index('Supplier Name'), header.index('Supplier INN')
+        batch = []
+        for row in iter_merged_rows(suppliers_file):
+            batch.append((row[name], row[inn] or None))
+            if len(batch) >= chunksize:
+                yield make_store_frame(*zip(*batch), 'supplier')
+                batch = []
+        if batch:
+            yield make_store_frame(*zip(*batch), 'supplier')
+        return
+
+    for df_suppliers in pd.read_csv(suppliers_file, dtype={'Supplier INN': 'string', 'Sanctioned': 'boolean'},
+                                    chunksize=chunksize):
+        # The screened supplier table (see src/screening.py) also carries each supplier's sanctions match
+        screened = 'Sanctions Score' in df_suppliers.columns
+        yield make_store_frame(df_suppliers['Supplier Name'], df_suppliers['Supplier INN'], 'supplier',
+                               df_suppliers['Sanctions Score'] if screened else None,
+                               df_suppliers['Sanctioned'] if screened else None)
+
+def run_merge(factories_file, suppliers_file, output_file, chunksize=100000):
+    """Merge factories and suppliers data into one typed store file (see src/store.py).
+
+    Both inputs are streamed in chunks of `chunksize` rows into the store, so
+    memory use does not grow with their size. `suppliers_file` may also be the
+    list of shard outputs of a sharded ClearSpending run (see src/sharding.py),
+    or the screened supplier table, whose sanctions score and status are kept.
+    """
+    counts = {'factory': 0, 'supplier': 0}
+
+    def frames():
+        # Step 1: Prepare the factories, dropping every column but caption and innCode
+        for df_factories in pd.read_csv(factories_file, dtype={'innCode': 'string'}, usecols=['caption', 'innCode'],
+                                        chunksize=chunksize):
+            counts['factory'] += len(df_factories)
+            yield make_store_frame(df_factories['caption'], df_factories['innCode'], 'factory')
+
+        # Step 2: Prepare the supplier data for merging
+        for suppliers in iter_supplier_frames(suppliers_file, chunksize):
+            counts['supplier'] += len(suppliers)
+            yield suppliers
+
+    # Step 3: Write the merged output, factories first, with a role column instead of section headers
+    rows = write_store_batches(frames(), output_file)
+    metrics.count_rows('merge', rows_in=rows, rows_out=rows)
+
+    print(f"Merged file created successfully at {output_file} "
+          f"({counts['factory']} factories, {counts['supplier']} suppliers)")
@@ -0,0 +1,60 @@
+import bz2
+import gzip
+import json
+
+# FollowTheMoney schemata that are legal entities (the API's schema=LegalEntity filter)
+LEGAL_ENTITY_SCHEMATA = {'LegalEntity', 'Company', 'Organization', 'PublicBody'}
+
+# Free-text properties searched when a keyword list is given
+TEXT_PROPERTIES = ('name', 'alias', 'previousName', 'sector', 'classification', 'summary', 'description', 'notes')
+
+OUTPUT_COLUMNS = ['id', 'caption', 'schema', 'taxNumber', 'innCode']
+
+def open_bulk_file(path):
+    """Open a bulk export as text, transparently decompressing .gz and .bz2 files."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+def iter_entities(path):
+    """Yield FtM entities one at a time from a line-delimited JSON bulk export."""
+    with open_bulk_file(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping malformed line {line_number}: {e}")
+
+def is_sanctioned_ru_entity(entity):
+    """Check the same filters the search API applies: country RU, legal entity schema, sanction topic."""
+    if entity.get('schema') not in LEGAL_ENTITY_SCHEMATA:
+        return False
+    properties = entity.get('properties', {})
+    if 'sanction' not in properties.get('topics', []):
+        return False
+    countries = properties.get('country', []) + properties.get('jurisdiction', [])
+    return any(country.lower() == 'ru' for country in countries)
+
+def entity_text(entity):
+    """Join the entity's caption and free-text properties into one searchable string."""
+    properties = entity.get('properties', {})
+    texts = [entity.get('caption', '')]
+    for prop in TEXT_PROPERTIES:
+        texts.extend(properties.get(prop, []))
+    return ' '.join(texts)
+
+def project_entity(entity):
+    """Reduce an entity to the columns written to the output CSV."""
+    properties = entity.get('properties', {})
+    return {
+        'id': entity.get('id'),
+        'caption': entity.get('caption'),
+        'schema': entity.get('schema'),
+        'taxNumber': properties.get('taxNumber', [None])[0],
+        'innCode': properties.get('innCode', [None])[0],
+    }
@@ -0,0 +1,210 @@
+import numpy as np
+import pandas as pd
+
+# Russian -> Latin transliteration, so Cyrillic and Latin spellings of a name compare equal
+TRANSLITERATION = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '',
+    'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+
+# Legal-form words and abbreviations (after transliteration) that do not identify a company
+LEGAL_FORMS = [
+    'public joint stock company', 'open joint stock company', 'closed joint stock company', 'joint stock company',
+    'limited liability company', 'federal state unitary enterprise', 'state unitary enterprise',
+    'aktsionernoe obshchestvo', 'publichnoe aktsionernoe obshchestvo', 'otkrytoe aktsionernoe obshchestvo',
+    'zakrytoe aktsionernoe obshchestvo', 'obshchestvo s ogranichennoy otvetstvennostyu',
+    'pjsc', 'ojsc', 'cjsc', 'jsc', 'llc', 'ltd', 'inc', 'co', 'company',
+    'pao', 'oao', 'zao', 'nao', 'ao', 'ooo', 'fgup', 'gup', 'mup', 'fkp', 'ip',
+]
+LEGAL_FORM_PATTERN = r'\b(?:' + '|'.join(form.replace(' ', r'\s+') for form in LEGAL_FORMS) + r')\b'
+
+NUM_PERMUTATIONS = 64
+BAND_ROWS = 4
+_PRIME = np.uint64((1 << 61) - 1)
+
+def normalize_captions(captions):
+    """Vectorized caption normalization: lowercase, transliterate, drop punctuation and legal forms."""
+    names = pd.Series(captions, dtype='string').fillna('').str.lower().str.translate(TRANSLITERATION)
+    names = names.str.replace(r'[^\w\s]', ' ', regex=True)
+    names = names.str.replace(LEGAL_FORM_PATTERN, ' ', regex=True)
+    return names.str.replace(r'\s+', ' ', regex=True).str.strip()
+
+def _sorted_unique(values):
+    """Sorted distinct values of an integer array (faster than np.unique on large arrays)."""
+    values = np.sort(values)
+    return values[np.r_[True, values[1:] != values[:-1]]] if len(values) else values
+
+def _shingles(names):
+    """Return (row, code) arrays of the distinct byte trigrams of every name, computed over one joined buffer."""
+    joined = '\n'.join(f' {name} ' for name in names) + '\n'
+    buf = np.frombuffer(joined.encode('utf-8'), dtype=np.uint8)
+    row_of = np.concatenate(([0], np.cumsum(buf == ord('\n'))[:-1]))
+
+    codes = (buf[:-2].astype(np.uint64) << np.uint64(16)) | (buf[1:-1].astype(np.uint64) << np.uint64(8)) | buf[2:]
+    separator = (buf == ord('\n'))
+    valid = ~(separator[:-2] | separator[1:-1] | separator[2:])
+    rows = row_of[:-2][valid].astype(np.uint64)
+    codes = codes[valid]
+
+    # Keep each (row, trigram) pair once; the result is sorted by row
+    pairs = _sorted_unique((rows << np.uint64(24)) | codes)
+    return (pairs >> np.uint64(24)).astype(np.int64), pairs & np.uint64(0xFFFFFF)
+
+def minhash_signatures(names, num_permutations=NUM_PERMUTATIONS, seed=0):
+    """Compute MinHash signatures of the names' trigram sets as an (n, num_permutations) matrix."""
+    n = len(names)
+    signatures = np.full((n, num_permutations), np.iinfo(np.uint64).max, dtype=np.uint64)
+    rows, codes = _shingles(names)
+    if len(rows) == 0:
+        return signatures
+
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    present = rows[starts]
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 31, size=num_permutations, dtype=np.uint64)
+    b = rng.integers(0, 1 << 31, size=num_permutations, dtype=np.uint64)
+    for k in range(num_permutations):
+        hashed = (a[k] * codes + b[k]) % _PRIME
+        signatures[present, k] = np.minimum.reduceat(hashed, starts)
+    return signatures
+
+def _neighbour_pairs(keys, eligible, window, tiebreak=None):
+    """Pairs of eligible rows with equal `keys` that are at most `window` apart in sorted order.
+
+    Rows sharing a key are ordered by `tiebreak` (e.g. the rank of the name), so
+    similar rows stay adjacent even in crowded blocks.
+    """
+    index = np.flatnonzero(eligible)
+    if tiebreak is None:
+        order = index[np.argsort(keys[index], kind='stable')]
+    else:
+        order = index[np.lexsort((tiebreak[index], keys[index]))]
+    sorted_keys = keys[order]
+    left, right = [], []
+    for distance in range(1, window + 1):
+        same = sorted_keys[distance:] == sorted_keys[:-distance]
+        left.append(order[:-distance][same])
+        right.append(order[distance:][same])
+    return np.concatenate(left), np.concatenate(right)
+
+def _connected_components(n, left, right):
+    """Label propagation with pointer jumping: every row gets the smallest row id of its component."""
+    labels = np.arange(n)
+    while True:
+        lowest = np.minimum(labels[left], labels[right])
+        updated = labels.copy()
+        np.minimum.at(updated, left, lowest)
+        np.minimum.at(updated, right, lowest)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+def _split_inn_conflicts(labels, inn_codes, has_inn, inn_left, inn_right, low, high, similarity):
+    """Break up clusters that rows without an INN have chained across two different INNs.
+
+    In such clusters each row with an INN keeps only its exact-INN group, and each
+    row without one joins the INN group it matched most closely (or stays alone).
+    """
+    n = len(labels)
+    inn_label = np.where(has_inn, inn_codes, -1)
+    distinct = pd.DataFrame({'label': labels[has_inn], 'inn': inn_label[has_inn]}).drop_duplicates()
+    conflicted_labels = distinct['label'][distinct['label'].duplicated()].unique()
+    if len(conflicted_labels) == 0:
+        return labels
+
+    conflicted = np.isin(labels, conflicted_labels)
+    exact = _connected_components(n, inn_left, inn_right)
+    labels = np.where(conflicted, np.arange(n), labels)
+    labels = np.where(conflicted & has_inn, exact, labels)
+
+    # Attach each row without an INN to its most similar directly matched row with an INN
+    both = np.concatenate([low, high]), np.concatenate([high, low]), np.concatenate([similarity, similarity])
+    row, partner, score = both
+    candidate = conflicted[row] & ~has_inn[row] & has_inn[partner]
+    if candidate.any():
+        best = pd.DataFrame({'row': row[candidate], 'partner': partner[candidate], 'score': score[candidate]})
+        best = best.sort_values('score', ascending=False, kind='stable').drop_duplicates('row')
+        labels[best['row'].to_numpy()] = exact[best['partner'].to_numpy()]
+    return labels
+
+def resolve_entities(df, caption_column='caption', inn_column='innCode', threshold=0.85, window=10):
+    """Cluster rows that describe the same entity and pick a canonical row per cluster.
+
+    Rows with the same INN always match. Otherwise candidate pairs come from
+    blocking: MinHash LSH bands over the normalized caption's trigrams, compared
+    within a sorted window of `window` neighbours, so the number of pairs grows
+    linearly with the row count. Pairs are scored by their estimated Jaccard
+    similarity and must reach `threshold`; the numbers in both names must agree
+    and two different INNs never end up in one cluster.
+
+    Returns a copy of `df` with `cluster_id` and `is_canonical` columns. The
+    canonical row is the first row of its cluster that has an INN (or the first
+    row when none has one).
+    """
+    n = len(df)
+    result = df.copy()
+    if n == 0:
+        result['cluster_id'] = pd.Series(dtype='int64')
+        result['is_canonical'] = pd.Series(dtype='bool')
+        return result
+
+    names = normalize_captions(df[caption_column])
+    inns = pd.Series(df[inn_column], dtype='string').reset_index(drop=True)
+    has_inn = inns.notna().to_numpy()
+    has_name = (names != '').to_numpy()
+
+    # Numbers in a name (plant No. 1 vs No. 2) must agree exactly
+    number_codes = pd.factorize(names.str.replace(r'[^0-9]+', ' ', regex=True).str.strip())[0]
+
+    # Exact INN blocks
+    inn_codes = pd.factorize(inns)[0]
+    inn_left, inn_right = _neighbour_pairs(inn_codes, has_inn, 1)
+
+    # MinHash LSH blocks on the names, each block sorted by name
+    name_rank = np.argsort(np.argsort(names.to_numpy(dtype=object), kind='stable'), kind='stable')
+    signatures = minhash_signatures(names.tolist())
+    name_left, name_right = [], []
+    for start in range(0, signatures.shape[1], BAND_ROWS):
+        band_keys = signatures[:, start].copy()
+        for column in range(start + 1, start + BAND_ROWS):
+            band_keys = band_keys * np.uint64(1000003) ^ signatures[:, column]
+        band_left, band_right = _neighbour_pairs(band_keys, has_name, window, name_rank)
+        name_left.append(band_left)
+        name_right.append(band_right)
+    name_left = np.concatenate(name_left)
+    name_right = np.concatenate(name_right)
+
+    # Score each distinct candidate pair once
+    low, high = np.minimum(name_left, name_right), np.maximum(name_left, name_right)
+    pair_ids = _sorted_unique(low.astype(np.int64) * n + high)
+    low, high = pair_ids // n, pair_ids % n
+    similarity = (signatures[low] == signatures[high]).mean(axis=1)
+    conflicting_inn = has_inn[low] & has_inn[high] & (inn_codes[low] != inn_codes[high])
+    matched = (similarity >= threshold) & ~conflicting_inn & (number_codes[low] == number_codes[high])
+    low, high, similarity = low[matched], high[matched], similarity[matched]
+
+    labels = _connected_components(n, np.concatenate([inn_left, low]), np.concatenate([inn_right, high]))
+    labels = _split_inn_conflicts(labels, inn_codes, has_inn, inn_left, inn_right, low, high, similarity)
+
+    # Canonical row: first row with an INN in each cluster, else the first row
+    positions = np.arange(n)
+    preference = np.where(has_inn, positions, positions + n)
+    order = np.lexsort((preference, labels))
+    first = np.r_[True, labels[order][1:] != labels[order][:-1]]
+    canonical = np.zeros(n, dtype=bool)
+    canonical[order[first]] = True
+
+    result['cluster_id'] = pd.factorize(labels)[0]
+    result['is_canonical'] = canonical
+    return result
+
+def run_entity_resolution(input_file, output_file, threshold=0.85):
+    """Cluster duplicate entities in a CSV with caption and innCode columns and keep one row per cluster."""
+    df = pd.read_csv(input_file, dtype={'innCode': 'string'})
+    resolved = resolve_entities(df, threshold=threshold)
+    canonical = resolved[resolved['is_canonical']].drop(columns=['is_canonical'])
+    canonical.to_csv(output_file, index=False)
+    print(f"Resolved {len(df)} rows into {len(canonical)} entities; saved to {output_file}")
@@ -1,68 +1,52 @@
-import pandas as pd
-
-def run_final_clean(merged_file, output_file):
-    """Clean the merged factories and suppliers data."""
+from src import metrics
+from src.entity_resolution import resolve_entities
+from src.store import SCREENING_COLUMNS, export_sections, read_sections, read_store, write_store
+
+def deduplicate(df):
+    """Remove entities whose innCode was already seen, keeping the first (factories come first).
+
+    Entities without an INN are only dropped when the same caption appears again in the same role.
+    """
+    has_inn = df['innCode'].notna()
+    duplicate = has_inn & df['innCode'].duplicated()
+    duplicate |= ~has_inn & df.duplicated(subset=['caption', 'role'])
+    return df[~duplicate].reset_index(drop=True)
+
+def run_final_clean(merged_file, output_file, store_file=None, resolve=False, with_screening=False):
+    """Clean the merged factories and suppliers data.
+
+    Reads the typed store written by run_merge (or, for older runs, a sectioned
+    CSV), removes duplicate INNs across both roles and exports the
+    ImportGenius-style CSV. The deduplicated entities are also written to
+    `store_file` when given. With `resolve`, near-duplicate captions of the
+    same entity (transliterations, legal-form variants) are also merged. With
+    `with_screening`, the export also has each supplier's sanctions score and
+    status (empty where no screening ran).
+    """
     
-    # Step 1: Load the merged CSV file
-    with open(merged_file, 'r', encoding='utf-8') as f:
-        raw_content = f.readlines()
-
-    # Step 2: Parse the raw content, handling "factories" and "suppliers" headers
-    factories_data = []
-    suppliers_data = []
-    current_section = None  # Track which section we're in
-
-    for line in raw_content:
-        # Identify the section headers and set the section we're in
-        if '**factories**' in line:
-            current_section = 'factories'
-            continue
-        elif '**suppliers**' in line:
-            current_section = 'suppliers'
-            continue
-
-        # Skip empty lines and column headers
-        if 'caption,innCode' in line or line.strip() == "":
-            continue
-
-        # Split the line into caption and innCode
-        parts = line.strip().split(',')
-        if len(parts) == 2:
-            caption, inn_code = parts[0].strip(), parts[1].strip()
-
-            # Append the data to the respective section
-            if current_section == 'factories':
-                factories_data.append([caption, inn_code])
-            elif current_section == 'suppliers':
-                suppliers_data.append([caption, inn_code])
-
-    # Step 3: Convert both sections to DataFrames
-    df_factories = pd.DataFrame(factories_data, columns=['caption', 'innCode'])
-    df_suppliers = pd.DataFrame(suppliers_data, columns=['caption', 'innCode'])
-
-    # Step 4: Identify and remove duplicate INNs
-    combined_df = pd.concat([df_factories, df_suppliers], ignore_index=True)
-
-    # Remove rows where the 'innCode' is duplicated
-    combined_df.drop_duplicates(subset='innCode', inplace=True)
-
-    # Step 5: Write the cleaned data back to a CSV file, maintaining the section headers
-    with open(output_file, 'w', encoding='utf-8') as f:
-        # Write the factories header
-        f.write('**factories**\n')
-        f.write('caption,innCode\n')
-        
-        # Write the cleaned factories data
-        df_factories.to_csv(f, header=False, index=False)
-
-        # Add some spacing
-        f.write('\n')
-
-        # Write the suppliers header
-        f.write('**suppliers**\n')
-        f.write('caption,innCode\n')
-
-        # Write the cleaned suppliers data
-        df_suppliers.to_csv(f, header=False, index=False)
+    # Step 1: Load the merged data
+    if merged_file.endswith('.csv'):
+        merged = read_sections(merged_file)
+    else:
+        merged = read_store(merged_file)
+
+    # Step 2: Identify and remove duplicate INNs; factories win over suppliers
+    merged = merged.sort_values('role', kind='stable')
+    combined_df = deduplicate(merged)
+    print(f"Removed {len(merged) - len(combined_df)} duplicate entities")
+
+    if resolve:
+        resolved = resolve_entities(combined_df)
+        print(f"Merged {(~resolved['is_canonical']).sum()} near-duplicate entities")
+        combined_df = combined_df[resolved['is_canonical'].to_numpy()].reset_index(drop=True)
+
+    metrics.count_rows('dedup', rows_in=len(merged), rows_out=len(combined_df))
+
+    # Step 3: Keep the typed result for later stages
+    if store_file:
+        write_store(combined_df, store_file)
+
+    # Step 4: Export the ImportGenius-style CSV, maintaining the section headers
+    export_sections(combined_df, output_file, extra_columns=SCREENING_COLUMNS if with_screening else ())
 
     print(f"Cleaned file created successfully at {output_file}")
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+# Modules are imported from the repository root, wherever the CLI is started from (e.g. cron)
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time allowed for the CLI module, in milliseconds
+CLI_BUDGET_MS = 50
+
+# Module each CLI command imports when it runs (reported, not budgeted)
+STAGE_MODULES = {
+    'fetch': 'src.OpenSanctionsv2',
+    'clean': 'src.cleaningscriptv2',
+    'suppliers': 'src.clearspendingv5',
+    'screen': 'src.screening',
+    'graph': 'src.supplier_graph',
+    'merge': 'src.datamerge',
+    'dedup': 'src.final_clean',
+    'translate': 'src.translate',
+    'batch': 'src.batch',
+}
+
+def measure_import_time(module, repeat=3):
+    """Cumulative import time of `module` in a fresh interpreter, best of `repeat` runs, in milliseconds."""
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                capture_output=True, text=True, cwd=REPO_ROOT)
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr.strip()}")
+
+        # Lines look like "import time:   self [us] | cumulative | imported package"
+        cumulative = None
+        for line in result.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                cumulative = int(fields[1])
+        if cumulative is not None and (best is None or cumulative < best):
+            best = cumulative
+    return best / 1000 if best is not None else None
+
+def format_ms(ms):
+    return f"{ms:.1f} ms" if ms is not None else "import time not reported"
+
+def check_import_budget(budget_ms=None, cli_module='main'):
+    """Measure the CLI's import time against its budget and report each stage's imports.
+
+    Returns True when the CLI module imports within budget.
+    """
+    budget_ms = CLI_BUDGET_MS if budget_ms is None else budget_ms
+    cli_ms = measure_import_time(cli_module)
+    within_budget = cli_ms is not None and cli_ms <= budget_ms
+    verdict = 'OK' if within_budget else 'OVER BUDGET' if cli_ms is not None else 'FAILED'
+    print(f"{cli_module}: {format_ms(cli_ms)} (budget {budget_ms:.0f} ms) {verdict}")
+    for command, module in STAGE_MODULES.items():
+        print(f"  {command:<10} imports {module}: {format_ms(measure_import_time(module))}")
+    return within_budget
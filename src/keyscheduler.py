@@ -0,0 +1,135 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from src import metrics
+
+class KeyPoolExhausted(RuntimeError):
+    """Raised when every API key in the pool has used up its quota."""
+
+class RateLimitExceeded(RuntimeError):
+    """Raised when a request is still rate limited after every allowed attempt."""
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (seconds or HTTP date) into seconds, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class _KeyState:
+    """Token bucket, quota counter and cooldown for a single API key."""
+
+    def __init__(self, key, rate, burst, quota):
+        self.key = key
+        self.rate = rate            # Tokens (requests) per second, adapted at runtime
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.quota = quota          # Maximum requests for this run, None for unlimited
+        self.used = 0
+        self.rate_limited = 0       # Consecutive 429 responses
+        self.cooldown_until = 0.0
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def exhausted(self):
+        return self.quota is not None and self.used >= self.quota
+
+    def wait_time(self, now):
+        """Seconds until this key may send its next request."""
+        if now < self.cooldown_until:
+            return self.cooldown_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class KeyScheduler:
+    """Hands out API keys from a pool so that all keys are used in parallel.
+
+    Each key has its own token bucket whose rate adapts to the server: it grows a
+    little after every success and halves on a 429. A rate-limited key cools down
+    for the Retry-After period (or an exponential backoff with jitter) and then
+    rejoins the rotation. Only when every key has hit its quota does `acquire`
+    raise KeyPoolExhausted.
+    """
+
+    def __init__(self, keys, rate=0.2, burst=1, quota=None, min_rate=0.02, max_rate=2.0,
+                 base_backoff=5.0, max_backoff=300.0):
+        if not keys:
+            raise ValueError("At least one API key is required.")
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._states = [_KeyState(key, rate, burst, quota) for key in keys]
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._states)
+
+    def key(self, index):
+        return self._states[index].key
+
+    def acquire(self):
+        """Block until some key may send a request, then return its index."""
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                available = [(i, s) for i, s in enumerate(self._states) if not s.exhausted()]
+                if not available:
+                    raise KeyPoolExhausted("All API keys have reached their quota. Please try again later.")
+
+                waits = []
+                for index, state in available:
+                    state.refill(now)
+                    waits.append((state.wait_time(now), state.used, index))
+                wait, _, index = min(waits)
+                if wait <= 0:
+                    state = self._states[index]
+                    state.tokens -= 1
+                    state.used += 1
+                    if now > start:
+                        metrics.add('key_wait_seconds', now - start)
+                    return index
+                self._cond.wait(wait)
+
+    def report_success(self, index):
+        """Record a successful request and nudge the key's rate upwards."""
+        with self._cond:
+            state = self._states[index]
+            state.rate_limited = 0
+            state.rate = min(self.max_rate, state.rate * 1.05 + 0.001)
+            self._cond.notify_all()
+
+    def report_rate_limited(self, index, retry_after=None):
+        """Record a 429 for a key: halve its rate and put it on cooldown."""
+        with self._cond:
+            state = self._states[index]
+            state.rate_limited += 1
+            state.rate = max(self.min_rate, state.rate / 2)
+            if retry_after is None:
+                retry_after = self.retry_delay(state.rate_limited)
+            state.cooldown_until = time.monotonic() + retry_after
+            state.tokens = 0
+            print(f"Rate limit exceeded for API Key #{index + 1}. Cooling down for {retry_after:.1f}s.")
+            self._cond.notify_all()
+
+    def retry_delay(self, attempt):
+        """Exponential backoff with jitter before retry number `attempt` (1 for the first retry), in seconds."""
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** (attempt - 1))
+        return random.uniform(backoff / 2, backoff)
+
+    def usage(self):
+        """Return the number of requests sent with each key."""
+        with self._cond:
+            return [state.used for state in self._states]
@@ -0,0 +1,112 @@
+import pickle
+import re
+from collections import defaultdict
+from src.entities import entity_text, is_sanctioned_ru_entity, iter_entities, project_entity
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+def tokenize(text):
+    """Split text into lowercase word tokens."""
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+class KeywordMatcher:
+    """Matches text against a whole keyword list with one compiled, case-insensitive alternation.
+
+    Keywords are tried longest first, so a single scan of the text replaces a
+    substring search per keyword.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = sorted({keyword.lower() for keyword in keywords if keyword}, key=len, reverse=True)
+        if self.keywords:
+            self.pattern = re.compile('|'.join(re.escape(keyword) for keyword in self.keywords), re.IGNORECASE)
+        else:
+            self.pattern = None
+
+    def search(self, text):
+        """Return True if any keyword occurs in `text`."""
+        return bool(self.pattern and text and self.pattern.search(text))
+
+    def find_all(self, text):
+        """Return the set of keywords that occur in `text`."""
+        if not (self.pattern and text):
+            return set()
+        return {match.lower() for match in self.pattern.findall(text)}
+
+class EntityIndex:
+    """In-memory inverted index from word tokens to entities.
+
+    Captions and free-text properties are indexed once; afterwards keyword
+    presets are answered locally, without any API calls. A keyword matches an
+    entity when all of its tokens occur in the entity's indexed text.
+    """
+
+    def __init__(self):
+        self.records = []                 # Projected output records, by document id
+        self.captions = []
+        self.postings = defaultdict(set)  # token -> ids of documents containing it
+        self._ids = {}                    # entity id -> document id
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, entity):
+        """Index one FtM entity (a search API result or a bulk export line)."""
+        entity_id = entity.get('id')
+        if entity_id in self._ids:
+            return
+        doc_id = len(self.records)
+        self._ids[entity_id] = doc_id
+        self.records.append(project_entity(entity))
+        self.captions.append(entity.get('caption', ''))
+
+        for token in set(tokenize(entity_text(entity))):
+            self.postings[token].add(doc_id)
+
+    def add_all(self, entities):
+        for entity in entities:
+            self.add(entity)
+        return self
+
+    @classmethod
+    def from_bulk(cls, bulk_file):
+        """Index the sanctioned Russian legal entities of a bulk FtM export."""
+        return cls().add_all(entity for entity in iter_entities(bulk_file) if is_sanctioned_ru_entity(entity))
+
+    @classmethod
+    def from_cache(cls, cache):
+        """Index every entity found in cached OpenSanctions search responses."""
+        index = cls()
+        for payload in cache.iter_payloads('search/sanctions'):
+            index.add_all(payload.get('results', []))
+        return index
+
+    def query(self, keyword):
+        """Return the ids of documents that contain every token of `keyword`."""
+        tokens = tokenize(keyword)
+        if not tokens:
+            return set()
+        postings = sorted((self.postings.get(token, set()) for token in tokens), key=len)
+        return set.intersection(*postings)
+
+    def query_preset(self, keywords, exclude_keywords=None):
+        """Return the records matching any keyword and none of the exclusion keywords, in index order."""
+        doc_ids = set()
+        for keyword in keywords:
+            doc_ids |= self.query(keyword)
+        if exclude_keywords:
+            exclude = KeywordMatcher(exclude_keywords)
+            doc_ids = {doc_id for doc_id in doc_ids if not exclude.search(self.captions[doc_id])}
+        return [self.records[doc_id] for doc_id in sorted(doc_ids)]
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump((self.records, self.captions, dict(self.postings), self._ids), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with open(path, 'rb') as f:
+            index.records, index.captions, postings, index._ids = pickle.load(f)
+        index.postings.update(postings)
+        return index
@@ -0,0 +1,221 @@
+import bisect
+from contextlib import contextmanager, nullcontext
+import json
+import os
+import threading
+import time
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Known API endpoints, matched against request URLs to label metrics
+ENDPOINTS = ('search/sanctions', 'filtered-contracts', 'match', 'translate')
+
+PROMETHEUS_PREFIX = 'ru_suppliers'
+
+def endpoint_name(url):
+    """Short metric label for the endpoint behind `url`."""
+    for endpoint in ENDPOINTS:
+        if endpoint in url:
+            return endpoint
+    return url.split('?')[0].rstrip('/').rsplit('/', 1)[-1] or url
+
+class Metrics:
+    """In-memory registry of the run's counters, timers and latency histograms.
+
+    Everything is keyed by plain strings (stage, endpoint, key label) and
+    guarded by one lock, so worker threads can record from anywhere.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.stages = {}
+        self.requests = {}
+        self.keys = {}
+        self.cache = {}
+        self.counters = {}
+
+    def _stage(self, name):
+        return self.stages.setdefault(name, {'runs': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                             'rows_in': 0, 'rows_out': 0})
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage's wall-clock and process CPU time (including its worker threads)."""
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                stage = self._stage(name)
+                stage['runs'] += 1
+                stage['wall_seconds'] += time.perf_counter() - wall
+                stage['cpu_seconds'] += time.process_time() - cpu
+
+    def count_rows(self, stage, rows_in=0, rows_out=0):
+        with self._lock:
+            stage = self._stage(stage)
+            stage['rows_in'] += rows_in
+            stage['rows_out'] += rows_out
+
+    def observe_request(self, endpoint, status, seconds, key=None):
+        """Record one API request: its status (HTTP code or 'error') and latency, and the key it used."""
+        status = str(status)
+        with self._lock:
+            request = self.requests.get(endpoint)
+            if request is None:
+                request = self.requests[endpoint] = {'count': 0, 'seconds': 0.0, 'statuses': {}, 'rate_limited': 0,
+                                                     'buckets': [0] * (len(LATENCY_BUCKETS) + 1)}
+            request['count'] += 1
+            request['seconds'] += seconds
+            request['statuses'][status] = request['statuses'].get(status, 0) + 1
+            request['buckets'][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            if status == '429':
+                request['rate_limited'] += 1
+            if key is not None:
+                usage = self.keys.setdefault(key, {'requests': 0, 'rate_limited': 0})
+                usage['requests'] += 1
+                usage['rate_limited'] += status == '429'
+
+    def observe_cache(self, endpoint, hit, count=1):
+        with self._lock:
+            lookups = self.cache.setdefault(endpoint, {'hits': 0, 'misses': 0})
+            lookups['hits' if hit else 'misses'] += count
+
+    def add(self, name, value=1):
+        """Add to a free-form counter, e.g. seconds spent waiting for an API key."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self):
+        """Return the whole run as a JSON-serializable dict."""
+        with self._lock:
+            requests = {}
+            for endpoint, request in self.requests.items():
+                requests[endpoint] = {
+                    'count': request['count'],
+                    'total_seconds': request['seconds'],
+                    'mean_seconds': request['seconds'] / request['count'],
+                    'statuses': dict(request['statuses']),
+                    'rate_limited': request['rate_limited'],
+                    'latency_histogram': {
+                        ('+Inf' if i == len(LATENCY_BUCKETS) else str(LATENCY_BUCKETS[i])): count
+                        for i, count in enumerate(request['buckets'])
+                    },
+                }
+            cache = {
+                endpoint: dict(lookups, hit_rate=lookups['hits'] / max(1, lookups['hits'] + lookups['misses']))
+                for endpoint, lookups in self.cache.items()
+            }
+            return {
+                'started': self.started,
+                'duration_seconds': time.time() - self.started,
+                'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                'requests': requests,
+                'keys': {key: dict(usage) for key, usage in self.keys.items()},
+                'cache': cache,
+                'counters': dict(self.counters),
+            }
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def prometheus_lines(self):
+        """Render the metrics in the Prometheus text exposition format."""
+        report = self.report()
+        p = PROMETHEUS_PREFIX
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {p}_{name} {help_text}')
+            lines.append(f'# TYPE {p}_{name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{label}="{_escape_label(str(v))}"' for label, v in labels.items())
+                lines.append(f'{p}_{name}{{{label_text}}} {value}' if label_text else f'{p}_{name} {value}')
+
+        stages = report['stages']
+        metric('stage_wall_seconds', 'gauge', 'Wall-clock time spent in each stage.',
+               [({'stage': s}, v['wall_seconds']) for s, v in stages.items()])
+        metric('stage_cpu_seconds', 'gauge', 'Process CPU time spent in each stage.',
+               [({'stage': s}, v['cpu_seconds']) for s, v in stages.items()])
+        metric('stage_rows_in', 'gauge', 'Rows read by each stage.',
+               [({'stage': s}, v['rows_in']) for s, v in stages.items()])
+        metric('stage_rows_out', 'gauge', 'Rows written by each stage.',
+               [({'stage': s}, v['rows_out']) for s, v in stages.items()])
+
+        requests = report['requests']
+        metric('http_requests_total', 'counter', 'API requests by endpoint and status.',
+               [({'endpoint': e, 'status': status}, count)
+                for e, v in requests.items() for status, count in v['statuses'].items()])
+        metric('http_rate_limited_total', 'counter', 'API requests answered with HTTP 429.',
+               [({'endpoint': e}, v['rate_limited']) for e, v in requests.items()])
+
+        lines.append(f'# HELP {p}_http_request_duration_seconds API request latency.')
+        lines.append(f'# TYPE {p}_http_request_duration_seconds histogram')
+        for endpoint, request in requests.items():
+            label = _escape_label(endpoint)
+            cumulative = 0
+            for bound, bucket_count in request['latency_histogram'].items():
+                cumulative += bucket_count
+                lines.append(f'{p}_http_request_duration_seconds_bucket{{endpoint="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{p}_http_request_duration_seconds_sum{{endpoint="{label}"}} {request["total_seconds"]}')
+            lines.append(f'{p}_http_request_duration_seconds_count{{endpoint="{label}"}} {request["count"]}')
+
+        metric('api_key_requests_total', 'counter', 'Requests sent with each API key.',
+               [({'key': k}, v['requests']) for k, v in report['keys'].items()])
+        metric('api_key_rate_limited_total', 'counter', 'HTTP 429 answers per API key.',
+               [({'key': k}, v['rate_limited']) for k, v in report['keys'].items()])
+        metric('cache_lookups_total', 'counter', 'Response cache lookups by endpoint and result.',
+               [({'endpoint': e, 'result': result}, v[field])
+                for e, v in report['cache'].items() for result, field in (('hit', 'hits'), ('miss', 'misses'))])
+        for name, value in report['counters'].items():
+            metric(f'{name}_total', 'counter', f'{name.replace("_", " ").capitalize()}.', [({}, value)])
+        return lines
+
+    def write_prometheus(self, path):
+        """Write a Prometheus textfile (for node_exporter's textfile collector), replacing it atomically."""
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.prometheus_lines()) + '\n')
+        os.replace(temporary, path)
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# The active registry; None while metrics are disabled, so every hook below is a single check
+_metrics = None
+
+def enable():
+    """Start collecting metrics for this process and return the registry."""
+    global _metrics
+    _metrics = Metrics()
+    return _metrics
+
+def disable():
+    global _metrics
+    _metrics = None
+
+def active():
+    return _metrics
+
+def stage(name):
+    return _metrics.stage(name) if _metrics is not None else nullcontext()
+
+def count_rows(stage, rows_in=0, rows_out=0):
+    if _metrics is not None:
+        _metrics.count_rows(stage, rows_in, rows_out)
+
+def observe_request(url, status, seconds, key=None):
+    if _metrics is not None:
+        _metrics.observe_request(endpoint_name(url), status, seconds, key)
+
+def observe_cache(url, hit, count=1):
+    if _metrics is not None:
+        _metrics.observe_cache(endpoint_name(url), hit, count)
+
+def add(name, value=1):
+    if _metrics is not None:
+        _metrics.add(name, value)
@@ -0,0 +1,230 @@
+import csv
+import os
+import queue
+import threading
+from itertools import islice
+import pandas as pd
+from src import metrics
+from src.OpenSanctionsv2 import combine_keywords, iter_opensanctions_pages
+from src.bulkingest import OUTPUT_COLUMNS as ENTITY_COLUMNS, iter_bulk_records
+from src.cleaningscriptv2 import clean_chunk, drop_seen
+from src.clearspendingv5 import OUTPUT_COLUMNS as SUPPLIER_COLUMNS, START_DATE, END_DATE, find_company_suppliers
+from src.final_clean import deduplicate
+from src.keyscheduler import KeyScheduler
+from src.session import make_session
+from src.store import export_sections, make_store_frame, write_store
+
+# End-of-stream marker passed through the queues
+_DONE = object()
+
+class CSVSink:
+    """Optional incremental CSV output for a stream of records; does nothing when `path` is None."""
+
+    def __init__(self, path, columns):
+        self._file = None
+        if path:
+            self._file = open(path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.DictWriter(self._file, fieldnames=columns, extrasaction='ignore')
+            self._writer.writeheader()
+        self._lock = threading.Lock()
+
+    def write(self, records):
+        if self._file is None:
+            return
+        with self._lock:
+            self._writer.writerows(records)
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+def _consume(inbox, handle, errors, name):
+    """Feed items from `inbox` to `handle` until the end marker.
+
+    After an error the stage keeps draining its inbox, so upstream stages never
+    block on a full queue.
+    """
+    failed = False
+    while True:
+        item = inbox.get()
+        if item is _DONE:
+            return
+        if failed:
+            continue
+        try:
+            handle(item)
+        except Exception as e:
+            print(f"Stage {name} failed: {e}")
+            errors.append((name, e))
+            failed = True
+
+def run_streaming_pipeline(output_dir, keywords, sanctions_api_key=None, clearspending_api_keys=(), google_credentials=None,
+                           bulk_file=None, cache=None, session=None, scheduler=None, translate_client=None, memo=None,
+                           queue_size=1000, batch_size=100, supplier_workers=None, write_intermediate=True):
+    """Run all stages at once, passing records between them through bounded queues.
+
+    Cleaned entities are looked up on ClearSpending as soon as they are produced,
+    and entities and suppliers are translated in batches as they arrive (reusing
+    the optional TranslationMemo `memo`), so the run takes
+    about as long as its slowest stage. The intermediate CSV files are written
+    incrementally when `write_intermediate` is set; the final sectioned files are
+    written once all stages have finished.
+    """
+    if scheduler is None:
+        scheduler = KeyScheduler(clearspending_api_keys)
+    if supplier_workers is None:
+        supplier_workers = 2 * len(scheduler)
+    if session is None:
+        session = make_session(pool_size=supplier_workers + 8)
+    if translate_client is None and google_credentials:
+        from src.translate import make_translate_client
+        translate_client = make_translate_client(google_credentials)
+
+    def output_path(name):
+        return os.path.join(output_dir, name) if write_intermediate else None
+
+    entity_sink = CSVSink(output_path("sanctioned_entities_with_inn.csv"), ENTITY_COLUMNS)
+    cleaned_sink = CSVSink(output_path("data_cleaned_finalv2.csv"), ['id', 'caption', 'schema', 'innCode'])
+    supplier_sink = CSVSink(output_path("top_3_suppliers_by_companyv2.csv"), SUPPLIER_COLUMNS)
+
+    raw_batches = queue.Queue(maxsize=queue_size)  # source -> clean
+    entities = queue.Queue(maxsize=queue_size)     # clean -> suppliers
+    names = queue.Queue(maxsize=queue_size)        # clean, suppliers -> translate/output
+    errors = []
+    incomplete = []  # Companies whose contracts could not all be fetched
+
+    def source():
+        """Produce batches of OpenSanctions records from the API or a bulk export."""
+        try:
+            if bulk_file:
+                records = iter_bulk_records(bulk_file, combine_keywords(keywords))
+                while True:
+                    batch = list(islice(records, batch_size))
+                    if not batch:
+                        break
+                    entity_sink.write(batch)
+                    raw_batches.put(batch)
+            else:
+                pages = iter_opensanctions_pages(sanctions_api_key, combine_keywords(keywords), session=session, cache=cache)
+                for _, _, results in pages:
+                    batch = [record._asdict() for record in results]
+                    if batch:
+                        entity_sink.write(batch)
+                        raw_batches.put(batch)
+        except Exception as e:
+            print(f"Stage fetch failed: {e}")
+            errors.append(('fetch', e))
+        finally:
+            raw_batches.put(_DONE)
+
+    seen_inns = set()
+    seen_ids = set()
+
+    def clean(batch):
+        """Clean one batch and hand every new entity on to the supplier lookups and the output."""
+        df = pd.DataFrame(batch, columns=ENTITY_COLUMNS).astype({'innCode': 'string', 'taxNumber': 'string'})
+        df = drop_seen(clean_chunk(df), seen_inns, seen_ids)
+        metrics.count_rows('clean', rows_in=len(batch), rows_out=len(df))
+        records = df.astype(object).where(df.notna(), None).to_dict(orient='records')
+        cleaned_sink.write(records)
+        for record in records:
+            entities.put(record)
+            names.put(('factories', record['caption'], record['innCode']))
+
+    def cleaner():
+        try:
+            _consume(raw_batches, clean, errors, 'clean')
+        finally:
+            names.put(_DONE)
+            for _ in range(supplier_workers):
+                entities.put(_DONE)
+
+    def find_suppliers(record):
+        rows, complete = find_company_suppliers(session, scheduler, record['caption'], record['innCode'], START_DATE,
+                                                END_DATE, cache=cache)
+        if not complete:
+            # Partial totals would rank the wrong suppliers first; leave the company without suppliers
+            incomplete.append(record['caption'])
+            return
+        supplier_sink.write(rows)
+        metrics.count_rows('suppliers', rows_in=1, rows_out=len(rows))
+        for row in rows:
+            names.put(('suppliers', row['Supplier Name'], row['Supplier INN']))
+
+    def supplier_worker():
+        _consume(entities, find_suppliers, errors, 'suppliers')
+
+    # Output stage: translate names in small batches as they arrive
+    sections = {'factories': [], 'suppliers': []}
+
+    def output():
+        from src.translate import translate_names
+        pending = []
+
+        def flush():
+            translations = {}
+            if translate_client is not None:
+                translations = translate_names(translate_client, [caption for _, caption, _ in pending], memo=memo)
+            for section, caption, inn in pending:
+                sections[section].append((caption, translations.get(caption, caption), inn))
+            metrics.count_rows('translate', rows_in=len(pending), rows_out=len(pending))
+            pending.clear()
+
+        producers_left = 2  # The cleaner and the supplier workers
+        while producers_left:
+            item = names.get()
+            if item is _DONE:
+                producers_left -= 1
+            else:
+                pending.append(item)
+            if len(pending) >= batch_size or (pending and names.empty()):
+                try:
+                    flush()
+                except Exception as e:
+                    print(f"Stage translate failed: {e}")
+                    errors.append(('translate', e))
+                    pending.clear()
+        flush()
+
+    threads = [threading.Thread(target=source, name='fetch'), threading.Thread(target=cleaner, name='clean')]
+    suppliers = [threading.Thread(target=supplier_worker, name=f'suppliers-{i}') for i in range(supplier_workers)]
+    output_thread = threading.Thread(target=output, name='output')
+    for thread in threads + suppliers + [output_thread]:
+        thread.start()
+    for thread in threads + suppliers:
+        thread.join()
+    names.put(_DONE)  # Signals that the supplier workers are finished
+    output_thread.join()
+
+    for sink in (entity_sink, cleaned_sink, supplier_sink):
+        sink.close()
+
+    # Deduplicate by INN: factories first, then suppliers not seen before
+    frames = []
+    for role, section in (('factory', 'factories'), ('supplier', 'suppliers')):
+        captions, translated, inns = zip(*sections[section]) if sections[section] else ((), (), ())
+        frame = make_store_frame(captions, inns, role)
+        frame['translated'] = pd.Series(translated, dtype='string')
+        frames.append(frame)
+    merged = pd.concat(frames, ignore_index=True)
+    entities_df = deduplicate(merged)
+    metrics.count_rows('dedup', rows_in=len(merged), rows_out=len(entities_df))
+
+    write_store(entities_df, os.path.join(output_dir, "entities.arrow"))
+    final_output = os.path.join(output_dir, "forImportGenius_no_duplicates.csv")
+    export_sections(entities_df, final_output)
+    print(f"Cleaned file created successfully at {final_output}")
+
+    if translate_client is not None:
+        translated_output = os.path.join(output_dir, "data_request.csv")
+        export_sections(entities_df, translated_output, caption_column='translated')
+        print(f"Translated file saved to: {translated_output}")
+
+    if incomplete:
+        print(f"Contracts of {len(incomplete)} companies were not all fetched, so they have no suppliers. "
+              f"Rerun to retry them.")
+    if errors:
+        print(f"Streaming pipeline finished with errors in: {', '.join(sorted({name for name, _ in errors}))}")
+        return False
+    return not incomplete
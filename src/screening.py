@@ -0,0 +1,163 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import time
+import requests
+import pandas as pd
+from src import metrics
+from src.session import make_session
+from src.keyscheduler import parse_retry_after
+
+MATCH_URL = 'https://api.opensanctions.org/match/sanctions'
+
+# Scoring algorithm and the score from which the API reports a result as a match
+MATCH_ALGORITHM = 'logic-v1'
+MATCH_THRESHOLD = 0.7
+
+# Entities packed into one /match request
+BATCH_SIZE = 50
+
+def supplier_queries(df, name_column='Supplier Name', inn_column='Supplier INN'):
+    """Build one match query per distinct supplier.
+
+    Suppliers are deduplicated by INN; all names seen for an INN go into the
+    same query. Suppliers without an INN are deduplicated by name. Returns
+    ({query key: query}, the query key of every row).
+    """
+    names = {}
+    row_keys = []
+    for name, inn in zip(df[name_column], df[inn_column]):
+        inn = None if pd.isna(inn) or not str(inn).strip() else str(inn).strip()
+        name = None if pd.isna(name) else str(name).strip()
+        key = f'inn:{inn}' if inn else f'name:{(name or "").lower()}'
+        row_keys.append(key)
+        if key not in names:
+            names[key] = (inn, [])
+        if name and name not in names[key][1]:
+            names[key][1].append(name)
+
+    queries = {}
+    for key, (inn, key_names) in names.items():
+        properties = {'name': key_names} if key_names else {}
+        if inn:
+            properties['innCode'] = [inn]
+        if key_names or inn:
+            queries[key] = {'schema': 'LegalEntity', 'properties': properties}
+    return queries, row_keys
+
+def summarize_matches(response):
+    """Reduce one query's /match response to its best result."""
+    best = max(response.get('results') or [], key=lambda result: result.get('score') or 0, default=None)
+    if best is None:
+        return {'score': 0.0, 'sanctioned': False, 'id': None, 'caption': None}
+    topics = best.get('topics') or []
+    return {
+        'score': best.get('score') or 0.0,
+        'sanctioned': bool(best.get('match')) and 'sanction' in topics,
+        'id': best.get('id'),
+        'caption': best.get('caption'),
+    }
+
+def match_batch(session, api_key, queries, params, max_attempts=5):
+    """Send a batch of queries to the match endpoint. Returns {query key: response}, or None on failure."""
+    headers = {'Authorization': f'Bearer {api_key}'}
+    for attempt in range(1, max_attempts + 1):
+        start = time.perf_counter()
+        try:
+            response = session.post(MATCH_URL, params=params, json={'queries': queries}, headers=headers)
+        except requests.exceptions.RequestException as e:
+            metrics.observe_request(MATCH_URL, 'error', time.perf_counter() - start)
+            print(f"Error querying the match API: {e}")
+            time.sleep(min(2 ** attempt, 30))
+            continue
+        metrics.observe_request(MATCH_URL, response.status_code, time.perf_counter() - start)
+
+        if response.status_code == 200:
+            return response.json().get('responses', {})
+        if response.status_code == 429 or response.status_code >= 500:
+            # Rate limited or a server hiccup: wait and send the same batch again
+            delay = parse_retry_after(response.headers.get('Retry-After'))
+            time.sleep(delay if delay is not None else min(2 ** attempt, 30))
+            continue
+        print(f"Match request failed: {response.status_code} - {response.text}")
+        return None
+    print(f"Giving up on a batch of {len(queries)} suppliers after {max_attempts} attempts.")
+    return None
+
+def screen_queries(queries, api_key, session=None, cache=None, batch_size=BATCH_SIZE, max_workers=4,
+                   algorithm=MATCH_ALGORITHM, threshold=MATCH_THRESHOLD):
+    """Screen match queries against the sanctions collection, `batch_size` queries per request.
+
+    Each query's response is cached on its own, so a rerun (or a query shared
+    with another run) is answered from the cache no matter how the batches were
+    cut. Returns {query key: summary}; queries that could not be screened are
+    left out.
+    """
+    params = {'algorithm': algorithm, 'threshold': threshold}
+
+    def cache_params(query):
+        return dict(params, query=json.dumps(query, sort_keys=True, ensure_ascii=False))
+
+    summaries = {}
+    todo = {}
+    for key, query in queries.items():
+        response = cache.get(MATCH_URL, cache_params(query)) if cache is not None else None
+        if response is not None:
+            summaries[key] = summarize_matches(response)
+        elif cache is not None and cache.offline:
+            print(f"Cache-only mode: no cached screening for {key}")
+        else:
+            todo[key] = query
+    if not todo:
+        return summaries
+
+    if session is None:
+        session = make_session(pool_size=max_workers)
+    keys = list(todo)
+    batches = [{key: todo[key] for key in keys[start:start + batch_size]} for start in range(0, len(keys), batch_size)]
+    print(f"Screening {len(todo)} suppliers in {len(batches)} requests ({len(summaries)} from the cache)...")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(match_batch, session, api_key, batch, params) for batch in batches]
+        for future, batch in zip(futures, batches):
+            responses = future.result()
+            if responses is None:
+                continue
+            for key, query in batch.items():
+                response = responses.get(key)
+                if response is None or response.get('status', 200) != 200:
+                    continue
+                if cache is not None:
+                    cache.set(MATCH_URL, cache_params(query), response)
+                summaries[key] = summarize_matches(response)
+    return summaries
+
+def run_screening(suppliers_file, output_file, api_key, session=None, cache=None, batch_size=BATCH_SIZE,
+                  max_workers=4, threshold=MATCH_THRESHOLD):
+    """Screen every supplier found by run_clearspending against the OpenSanctions sanctions lists.
+
+    Distinct suppliers are matched by name and INN through the `/match`
+    endpoint, many per request, and the supplier table is written to
+    `output_file` with their best match score, whether that match is
+    sanctioned, and the matched entity. Returns True once every supplier is
+    screened; rerunning only sends the ones still missing.
+    """
+    df = pd.read_csv(suppliers_file, dtype={'Supplier INN': 'string'})
+    queries, row_keys = supplier_queries(df)
+    summaries = screen_queries(queries, api_key, session=session, cache=cache, batch_size=batch_size,
+                               max_workers=max_workers, threshold=threshold)
+
+    rows = [summaries.get(key) for key in row_keys]
+    df['Sanctions Score'] = [row['score'] if row else None for row in rows]
+    df['Sanctioned'] = pd.array([row['sanctioned'] if row else None for row in rows], dtype='boolean')
+    df['Sanctions Match ID'] = [row['id'] if row else None for row in rows]
+    df['Sanctions Match'] = [row['caption'] if row else None for row in rows]
+    df.to_csv(output_file, index=False)
+    metrics.count_rows('screen', rows_in=len(df), rows_out=len(df))
+
+    sanctioned = {key for key, summary in summaries.items() if summary['sanctioned']}
+    print(f"Screened {len(summaries)} of {len(queries)} distinct suppliers: {len(sanctioned)} sanctioned. "
+          f"Saved to {output_file}")
+    missing = len(queries) - len(summaries)
+    if missing:
+        print(f"{missing} suppliers could not be screened. Rerun to retry them.")
+    return missing == 0
@@ -0,0 +1,10 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+def make_session(pool_size=10):
+    """Create a requests Session that keeps up to `pool_size` keep-alive connections per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
@@ -0,0 +1,155 @@
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import heapq
+import os
+import zlib
+
+# Column added to shard inputs and outputs: the row's position in the unsharded input
+ROW_COLUMN = '_row'
+
+def shard_index(key, shards):
+    """Stable shard of a key (CRC-32, identical in every process and on every host)."""
+    return zlib.crc32(str(key).encode('utf-8')) % shards
+
+def shard_path(path, index, shards):
+    """Path of shard `index` of `shards` for a stage file, e.g. data.csv -> data.shard-1-of-4.csv."""
+    root, ext = os.path.splitext(path)
+    return f'{root}.shard-{index}-of-{shards}{ext}'
+
+def split_into_shards(input_file, shards, shard_dir=None, key_column='innCode', fallback_column='caption'):
+    """Split a CSV into `shards` files by a stable hash of `key_column`, streaming row by row.
+
+    Rows without a key are placed by `fallback_column` instead. Each shard keeps
+    the input order and gets a ROW_COLUMN with the row's position in the input,
+    so shard outputs can be merged back in order. Returns the shard paths.
+    """
+    base = os.path.join(shard_dir, os.path.basename(input_file)) if shard_dir else input_file
+    paths = [shard_path(base, index, shards) for index in range(shards)]
+    files = [open(path, 'w', newline='', encoding='utf-8') for path in paths]
+    try:
+        with open(input_file, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            key = header.index(key_column)
+            fallback = header.index(fallback_column)
+            writers = [csv.writer(shard_file) for shard_file in files]
+            for writer in writers:
+                writer.writerow([ROW_COLUMN] + header)
+            for row_number, row in enumerate(reader):
+                value = row[key] or row[fallback]
+                writers[shard_index(value, shards)].writerow([row_number] + row)
+    finally:
+        for shard_file in files:
+            shard_file.close()
+    return paths
+
+def _iter_rows(path, source):
+    """Yield ((row number, source), row without the row column) from a shard output."""
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        row_index = header.index(ROW_COLUMN)
+        for row in reader:
+            yield (int(row[row_index]), source), row[:row_index] + row[row_index + 1:]
+
+def shard_header(path):
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f))
+    return [column for column in header if column != ROW_COLUMN]
+
+def iter_merged_rows(paths):
+    """Streaming k-way merge of shard outputs back into input order.
+
+    Each shard output is sorted by ROW_COLUMN, so only one row per shard is held
+    at a time. An input row found in more than one shard output (e.g. a stale
+    file from an earlier split) is only taken from the first shard it is seen in.
+    """
+    merged = heapq.merge(*[_iter_rows(path, source) for source, path in enumerate(paths)])
+    current = None
+    for (row_number, source), row in merged:
+        if current is None or current[0] != row_number:
+            current = (row_number, source)
+        elif current[1] != source:
+            continue  # Duplicate of a row already taken from another shard
+        yield row
+
+def merge_shard_outputs(paths, output_file):
+    """Write the k-way merge of shard outputs as one CSV, in input order. Returns the number of rows."""
+    rows = 0
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(shard_header(paths[0]))
+        for row in iter_merged_rows(paths):
+            writer.writerow(row)
+            rows += 1
+    return rows
+
+def run_shard(shard_input, shard_output, api_keys, cache_file=None, store_file=None, session_factory=None,
+              scheduler_options=None, cache_offline=False, **options):
+    """Run the ClearSpending stage on one shard; the entry point of each worker process.
+
+    A worker opens its own session, response cache and supplier store (the
+    SQLite files can be shared between processes) and paces its own key pool.
+    """
+    from src.cache import ResponseCache
+    from src.clearspendingv5 import run_clearspending
+    from src.keyscheduler import KeyScheduler
+    from src.supplier_store import SupplierStore
+
+    cache = ResponseCache(cache_file, offline=cache_offline) if cache_file else None
+    store = SupplierStore(store_file) if store_file else None
+    try:
+        return run_clearspending(shard_input, shard_output, api_keys, cache=cache,
+                                 session=session_factory() if session_factory else None,
+                                 scheduler=KeyScheduler(api_keys, **(scheduler_options or {})), store=store,
+                                 row_column=ROW_COLUMN, **options)
+    finally:
+        if cache is not None:
+            cache.close()
+        if store is not None:
+            store.close()
+
+def split_key_pools(api_keys, pools):
+    """Deal API keys round-robin into `pools` disjoint pools."""
+    return [api_keys[index::pools] for index in range(pools) if api_keys[index::pools]]
+
+def run_sharded_clearspending(input_file, output_file, key_pools, shards=None, shard_dir=None, only_shard=None,
+                              processes=None, merge=True, **options):
+    """Run the ClearSpending stage as `shards` independent shards, one process per shard.
+
+    The input is split by a stable INN hash, each shard runs in its own process
+    with its own key pool (`key_pools[i % len(key_pools)]`) and writes its own
+    output, and the shard outputs are merged back into `output_file` in input
+    order. The result is the same file an unsharded run writes.
+
+    On several hosts, run the same command with `only_shard` set to a different
+    shard on each, collect the shard outputs in one place and merge them with
+    merge_shard_outputs. Returns True once every shard that ran is complete.
+    """
+    shards = shards or len(key_pools)
+    if shards > len(key_pools):
+        print(f"Warning: {shards} shards share {len(key_pools)} key pools; shards on the same pool compete for its rate.")
+    if shard_dir:
+        os.makedirs(shard_dir, exist_ok=True)
+    shard_inputs = split_into_shards(input_file, shards, shard_dir)
+    base = os.path.join(shard_dir, os.path.basename(output_file)) if shard_dir else output_file
+    shard_outputs = [shard_path(base, index, shards) for index in range(shards)]
+
+    indexes = range(shards) if only_shard is None else [only_shard]
+    workers = min(len(indexes), processes or len(indexes))
+    print(f"Running {len(indexes)} of {shards} shards in {workers} processes...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {index: executor.submit(run_shard, shard_inputs[index], shard_outputs[index],
+                                          key_pools[index % len(key_pools)], **options)
+                   for index in indexes}
+        completed = {index: future.result() for index, future in futures.items()}
+
+    for index, complete in completed.items():
+        if not complete:
+            print(f"Shard {index} of {shards} is incomplete. Rerun to continue it.")
+    if merge and only_shard is None:
+        rows = merge_shard_outputs(shard_outputs, output_file)
+        print(f"Merged {shards} shard outputs into {output_file} ({rows} rows)")
+    return all(completed.values())
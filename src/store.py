@@ -0,0 +1,139 @@
+import csv
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+
+# Roles of the entities in the store, in the order their sections are exported
+ROLES = ['factory', 'supplier']
+SECTION_NAMES = {'factory': 'factories', 'supplier': 'suppliers'}
+
+# Sanctions screening of suppliers (see src/screening.py); empty for entities that were not screened
+SCREENING_COLUMNS = ['sanctionsScore', 'sanctioned']
+
+STORE_SCHEMA = pa.schema([
+    ('caption', pa.string()),
+    ('innCode', pa.string()),
+    ('role', pa.dictionary(pa.int8(), pa.string())),
+    ('sanctionsScore', pa.float64()),
+    ('sanctioned', pa.bool_()),
+])
+STORE_COLUMNS = STORE_SCHEMA.names
+
+def make_store_frame(captions, inns, role, scores=None, sanctioned=None):
+    """Build a typed store DataFrame for entities that all have the same role."""
+    empty = [None] * len(captions)
+    return pd.DataFrame({
+        'caption': pd.Series(captions, dtype='string').reset_index(drop=True),
+        'innCode': pd.Series(inns, dtype='string').reset_index(drop=True),
+        'role': pd.Categorical([role] * len(captions), categories=ROLES),
+        'sanctionsScore': pd.Series(empty if scores is None else scores, dtype='Float64').reset_index(drop=True),
+        'sanctioned': pd.Series(empty if sanctioned is None else sanctioned, dtype='boolean').reset_index(drop=True),
+    })
+
+def _store_table(df):
+    """Arrow table of a store DataFrame; columns it lacks (e.g. from older store files) are left empty."""
+    columns = {column: df[column] if column in df.columns else pd.Series([None] * len(df), dtype=object)
+               for column in STORE_COLUMNS}
+    return pa.Table.from_pandas(pd.DataFrame(columns, index=df.index), schema=STORE_SCHEMA, preserve_index=False)
+
+def write_store(df, path):
+    """Write entities to an uncompressed Arrow (Feather v2) file that can be memory-mapped on read."""
+    feather.write_feather(_store_table(df), path, compression='uncompressed')
+
+def write_store_batches(frames, path):
+    """Write store DataFrames to one Arrow file batch by batch, so the whole table is never in memory.
+
+    Returns the number of rows written.
+    """
+    rows = 0
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, STORE_SCHEMA) as writer:
+        for df in frames:
+            writer.write_table(_store_table(df))
+            rows += len(df)
+    return rows
+
+def _arrow_dtype(arrow_type):
+    """Keep columns as Arrow-backed pandas columns, which wrap the Arrow buffers without a copy."""
+    if pa.types.is_dictionary(arrow_type):
+        return None
+    return pd.ArrowDtype(arrow_type)
+
+def read_store(path, columns=None):
+    """Read a store file through a memory map without copying its string columns.
+
+    Columns stay Arrow-backed (pd.ArrowDtype) on the mapped buffers; only the
+    small role codes are converted into a Categorical.
+    """
+    table = feather.read_table(path, columns=columns, memory_map=True)
+    df = table.to_pandas(types_mapper=_arrow_dtype, split_blocks=True)
+    if 'role' in df.columns:
+        df['role'] = df['role'].cat.set_categories(ROLES)
+    return df
+
+def write_sections(output_file, df_factories, df_suppliers, header=('caption', 'innCode')):
+    """Write factories and suppliers (caption, innCode, ...) to the sectioned ImportGenius-style CSV."""
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        # Write the factories header
+        f.write('**factories**\n')
+        f.write(','.join(header) + '\n')
+
+        # Write the cleaned factories data
+        df_factories.to_csv(f, header=False, index=False)
+
+        # Add some spacing
+        f.write('\n')
+
+        # Write the suppliers header
+        f.write('**suppliers**\n')
+        f.write(','.join(header) + '\n')
+
+        # Write the cleaned suppliers data
+        df_suppliers.to_csv(f, header=False, index=False)
+
+def export_sections(df, output_file, caption_column='caption', extra_columns=()):
+    """Export a store DataFrame as the sectioned ImportGenius-style CSV.
+
+    The columns are caption and innCode; `extra_columns` (e.g. SCREENING_COLUMNS)
+    are appended to them when asked for.
+    """
+    columns = [caption_column, 'innCode'] + list(extra_columns)
+    sections = [df.loc[df['role'] == role, columns] for role in ROLES]
+    write_sections(output_file, *sections, header=['caption', 'innCode'] + list(extra_columns))
+
+def _field(fields, index):
+    """The field at `index` of a CSV row, or None when it is missing or empty."""
+    if index is None or index >= len(fields) or fields[index] == '':
+        return None
+    return fields[index]
+
+def read_sections(path):
+    """Parse a sectioned ImportGenius-style CSV back into a store DataFrame.
+
+    Fields are read with the csv module, so captions containing quoted commas
+    survive the round trip. Screening columns are read when a section has them.
+    """
+    rows = {role: ([], [], [], []) for role in ROLES}
+    roles_by_section = {f'**{name}**': role for role, name in SECTION_NAMES.items()}
+    current_role = None
+    screening = {}  # Screening column -> its position in the current section
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        for fields in csv.reader(f):
+            if not fields or not ''.join(fields).strip():
+                continue
+            if fields[0] in roles_by_section:
+                current_role = roles_by_section[fields[0]]
+                continue
+            if current_role is None:
+                continue
+            if fields[:2] == ['caption', 'innCode']:
+                screening = {column: fields.index(column) for column in SCREENING_COLUMNS if column in fields}
+                continue
+            captions, inns, scores, sanctioned = rows[current_role]
+            captions.append(fields[0])
+            inns.append(_field(fields, 1))
+            score = _field(fields, screening.get('sanctionsScore'))
+            scores.append(float(score) if score is not None else None)
+            flag = _field(fields, screening.get('sanctioned'))
+            sanctioned.append(flag == 'True' if flag is not None else None)
+
+    return pd.concat([make_store_frame(*rows[role][:2], role, *rows[role][2:]) for role in ROLES], ignore_index=True)
@@ -0,0 +1,164 @@
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+import csv
+from xml.sax.saxutils import escape, quoteattr
+import pandas as pd
+from src.clearspendingv5 import START_DATE, END_DATE, aggregate_top_suppliers, iter_contracts
+from src.keyscheduler import KeyScheduler, KeyPoolExhausted, RateLimitExceeded
+from src.session import make_session
+
+class SupplierGraph:
+    """Compact customer -> supplier graph.
+
+    INNs are interned to consecutive integer ids and edges are kept in three
+    parallel typed arrays (customer id, supplier id, contract value), so the
+    graph costs a few bytes per edge rather than a Python object.
+    """
+
+    def __init__(self):
+        self.ids = {}             # INN -> node id
+        self.inns = []            # node id -> INN
+        self.names = []           # node id -> name
+        self.tiers = array('b')   # node id -> tier (0 for the seed customers)
+        self.sources = array('l')
+        self.targets = array('l')
+        self.weights = array('d')
+        self.incomplete = []      # INNs whose suppliers could not all be fetched
+
+    def __len__(self):
+        return len(self.inns)
+
+    @property
+    def edge_count(self):
+        return len(self.sources)
+
+    def intern(self, inn, name=None, tier=0):
+        """Return the node id of an INN, adding the node on first sight."""
+        node = self.ids.get(inn)
+        if node is None:
+            node = len(self.inns)
+            self.ids[inn] = node
+            self.inns.append(inn)
+            self.names.append(name)
+            self.tiers.append(tier)
+        elif name and not self.names[node]:
+            self.names[node] = name
+        return node
+
+    def add_edge(self, customer_inn, supplier_inn, supplier_name, weight, tier):
+        if not supplier_inn:
+            return  # A supplier without an INN cannot be told apart from others, so it gets no node
+        self.sources.append(self.intern(customer_inn))
+        self.targets.append(self.intern(supplier_inn, supplier_name, tier))
+        self.weights.append(float(weight or 0))
+
+    def to_edge_list(self, path):
+        """Write the edges as CSV: customer and supplier INN/name, contract value and supplier tier."""
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Customer INN', 'Customer Name', 'Supplier INN', 'Supplier Name', 'Total Contract Value', 'Tier'])
+            for source, target, weight in zip(self.sources, self.targets, self.weights):
+                writer.writerow([self.inns[source], self.names[source], self.inns[target], self.names[target],
+                                 weight, self.tiers[target]])
+
+    def to_graphml(self, path):
+        """Write the graph as GraphML, streaming nodes and edges to the file."""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+            f.write('  <key id="inn" for="node" attr.name="inn" attr.type="string"/>\n')
+            f.write('  <key id="name" for="node" attr.name="name" attr.type="string"/>\n')
+            f.write('  <key id="tier" for="node" attr.name="tier" attr.type="int"/>\n')
+            f.write('  <key id="value" for="edge" attr.name="total_contract_value" attr.type="double"/>\n')
+            f.write('  <graph id="suppliers" edgedefault="directed">\n')
+            for node, (inn, name, tier) in enumerate(zip(self.inns, self.names, self.tiers)):
+                f.write(f'    <node id="n{node}"><data key="inn">{escape(str(inn))}</data>'
+                        f'<data key="name">{escape(str(name or ""))}</data><data key="tier">{tier}</data></node>\n')
+            for edge, (source, target, weight) in enumerate(zip(self.sources, self.targets, self.weights)):
+                f.write(f'    <edge id={quoteattr(f"e{edge}")} source="n{source}" target="n{target}">'
+                        f'<data key="value">{weight}</data></edge>\n')
+            f.write('  </graph>\n</graphml>\n')
+
+def crawl_supplier_graph(seeds, session, scheduler, depth=2, fan_out=3, cache=None, max_workers=None,
+                         start_date=START_DATE, end_date=END_DATE, max_pages=None):
+    """Breadth-first crawl of the supplier graph starting from (inn, name) seed customers.
+
+    Tier 1 are the top `fan_out` suppliers of the seeds, tier 2 their suppliers,
+    and so on up to `depth`. Every INN is queried at most once however many
+    customers it supplies, so the number of API calls grows with the number of
+    distinct INNs, not edges. Each tier's frontier is expanded concurrently.
+    """
+    if max_workers is None:
+        max_workers = 2 * len(scheduler)
+
+    graph = SupplierGraph()
+    visited = set()
+    frontier = []
+    for inn, name in seeds:
+        if inn and inn not in visited:
+            visited.add(inn)
+            graph.intern(inn, name, tier=0)
+            frontier.append(inn)
+
+    def expand(inn):
+        """Return the top suppliers of one customer, or None if its contracts could not all be fetched."""
+        status = {}
+        try:
+            contracts = iter_contracts(session, scheduler, inn, start_date=start_date, end_date=end_date,
+                                       cache=cache, max_pages=max_pages, status=status)
+            suppliers = aggregate_top_suppliers(contracts, top_k=fan_out)
+        except RateLimitExceeded as e:
+            print(e)
+            return None
+        return suppliers if status['complete'] else None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for tier in range(1, depth + 1):
+            if not frontier:
+                break
+            print(f"\n--- Expanding tier {tier}: {len(frontier)} customers ---")
+            next_frontier = []
+            try:
+                for inn, suppliers in zip(frontier, executor.map(expand, frontier)):
+                    if suppliers is None:
+                        graph.incomplete.append(inn)
+                    for supplier_inn, supplier_info in suppliers or []:
+                        graph.add_edge(inn, supplier_inn, supplier_info['name'], supplier_info['total_value'], tier)
+                        if supplier_inn and supplier_inn not in visited:
+                            visited.add(supplier_inn)
+                            next_frontier.append(supplier_inn)
+            except KeyPoolExhausted as e:
+                print(e)
+                graph.incomplete.extend(inn for inn in frontier if inn not in graph.incomplete)
+                break
+            frontier = next_frontier
+
+    print(f"Supplier graph: {len(graph)} companies, {graph.edge_count} supplier links")
+    return graph
+
+def run_supplier_graph(input_file, edge_list_file, api_keys, graphml_file=None, depth=2, fan_out=3, cache=None,
+                       session=None, scheduler=None):
+    """Crawl the multi-tier supplier graph of the cleaned entities and export it.
+
+    Returns True when every company in the graph was expanded from all of its
+    contracts; companies that were not are listed and left without suppliers.
+    """
+    if scheduler is None:
+        scheduler = KeyScheduler(api_keys)
+    if session is None:
+        session = make_session(pool_size=2 * len(scheduler))
+
+    data = pd.read_csv(input_file, dtype={'innCode': 'string'})
+    data = data[data['innCode'].notna()]
+    seeds = zip(data['innCode'], data['caption'])
+
+    graph = crawl_supplier_graph(seeds, session, scheduler, depth=depth, fan_out=fan_out, cache=cache)
+    graph.to_edge_list(edge_list_file)
+    print(f"Supplier edge list saved to {edge_list_file}")
+    if graphml_file:
+        graph.to_graphml(graphml_file)
+        print(f"Supplier graph saved to {graphml_file}")
+    if graph.incomplete:
+        print(f"{len(graph.incomplete)} companies could not be expanded: {', '.join(graph.incomplete[:10])}"
+              f"{' ...' if len(graph.incomplete) > 10 else ''}. Rerun to retry them.")
+    return not graph.incomplete
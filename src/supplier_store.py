@@ -0,0 +1,113 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+def contract_key(contract):
+    """Stable identity of a contract: its registry number when the API gives one, else a hash of its fields."""
+    for field in ('regNum', 'id', '_id'):
+        if contract.get(field):
+            return str(contract[field])
+    raw = json.dumps(contract, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def supplier_totals(contracts):
+    """Total contract value and contract count per supplier: {supplier_inn: {'name', 'total_value', 'contracts'}}."""
+    suppliers = {}
+    for contract in contracts:
+        supplier_inns = contract.get('supplier_inns') or []
+        supplier_names = contract.get('supplier_names') or []
+        amount = contract.get('amount_rur') or 0
+        for supplier_inn, supplier_name in zip(supplier_inns, supplier_names):
+            supplier = suppliers.get(supplier_inn)
+            if supplier is None:
+                suppliers[supplier_inn] = {'name': supplier_name, 'total_value': amount, 'contracts': 1}
+            else:
+                supplier['total_value'] += amount
+                supplier['contracts'] += 1
+    return suppliers
+
+class SupplierStore:
+    """Per-customer supplier totals and sync watermarks stored in SQLite, kept across runs.
+
+    For every customer INN the store records the contract window its totals cover
+    (`start_date` up to the `synced_through` watermark), a running total per
+    supplier and the keys of the contracts already counted. A refresh then only
+    fetches contracts signed since the watermark and merges them in; contracts
+    seen before are skipped, so overlapping fetches never count twice.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS watermarks (inn TEXT PRIMARY KEY, start_date TEXT, synced_through TEXT, synced_at REAL)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS suppliers (inn TEXT, supplier_inn TEXT, name TEXT, total_value REAL, '
+            'contracts INTEGER, PRIMARY KEY (inn, supplier_inn))'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS contracts (inn TEXT, contract_key TEXT, PRIMARY KEY (inn, contract_key)) WITHOUT ROWID'
+        )
+        self._conn.commit()
+
+    def watermark(self, inn):
+        """Return (start_date, synced_through) of the window stored for `inn`, or None if it was never synced."""
+        with self._lock:
+            return self._conn.execute('SELECT start_date, synced_through FROM watermarks WHERE inn = ?',
+                                      (inn,)).fetchone()
+
+    def reset(self, inn):
+        """Forget everything stored for `inn`, so its next sync starts from scratch."""
+        with self._lock, self._conn:
+            for table in ('watermarks', 'suppliers', 'contracts'):
+                self._conn.execute(f'DELETE FROM {table} WHERE inn = ?', (inn,))
+
+    def merge(self, inn, contracts):
+        """Add the contracts not counted yet to the supplier totals of `inn`; returns how many were new."""
+        by_key = {contract_key(contract): contract for contract in contracts}
+        keys = list(by_key)
+        with self._lock, self._conn:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for (key,) in self._conn.execute(
+                        f'SELECT contract_key FROM contracts WHERE inn = ? AND contract_key IN ({placeholders})',
+                        [inn] + chunk):
+                    del by_key[key]
+            if not by_key:
+                return 0
+
+            self._conn.executemany('INSERT INTO contracts (inn, contract_key) VALUES (?, ?)',
+                                   [(inn, key) for key in by_key])
+            self._conn.executemany(
+                'INSERT INTO suppliers (inn, supplier_inn, name, total_value, contracts) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (inn, supplier_inn) DO UPDATE SET total_value = total_value + excluded.total_value, '
+                'contracts = contracts + excluded.contracts',
+                [(inn, supplier_inn, supplier['name'], supplier['total_value'], supplier['contracts'])
+                 for supplier_inn, supplier in supplier_totals(by_key.values()).items()]
+            )
+        return len(by_key)
+
+    def set_watermark(self, inn, start_date, synced_through):
+        """Record that the totals of `inn` now cover every contract signed from `start_date` to `synced_through`."""
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO watermarks (inn, start_date, synced_through, synced_at) '
+                               'VALUES (?, ?, ?, ?)', (inn, start_date, synced_through, time.time()))
+
+    def top_suppliers(self, inn, top_k=3):
+        """The `top_k` suppliers of `inn` by total value, as (supplier_inn, {'name': ..., 'total_value': ...})."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT supplier_inn, name, total_value FROM suppliers WHERE inn = ? '
+                'ORDER BY total_value DESC LIMIT ?', (inn, top_k)
+            ).fetchall()
+        return [(supplier_inn, {'name': name, 'total_value': total_value}) for supplier_inn, name, total_value in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
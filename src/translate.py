@@ -1,39 +1,167 @@
-import pandas as pd
-from google.cloud import translate_v2 as translate
-import os
+from concurrent.futures import ThreadPoolExecutor
 import html
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+from src import metrics
+from src.store import SCREENING_COLUMNS, export_sections, read_sections
+
+# Google Translate v2 accepts at most 128 text segments per request
+MAX_SEGMENTS_PER_REQUEST = 128
+MAX_CHARS_PER_REQUEST = 30000
+
+CYRILLIC_PATTERN = r'[А-Яа-яЁё]'
+
+def make_translate_client(google_credentials):
+    """Create a Google Cloud Translate client from a service-account JSON file."""
+    from google.cloud import translate_v2 as translate
 
-def run_translation(input_file, output_file, google_credentials):
-    """Run the translation process on the specified input file."""
-    
     # Set up Google Cloud credentials
     os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = google_credentials
 
     # Initialize the Google Cloud Translate client
-    translate_client = translate.Client()
+    return translate.Client()
+
+class StubTranslateClient:
+    """Offline stand-in for the Google client: 'translates' by prefixing the target language."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def translate(self, values, target_language='ru'):
+        self.requests += 1
+        single = isinstance(values, str)
+        texts = [values] if single else list(values)
+        results = [{'input': text, 'translatedText': f'[{target_language}] {text}'} for text in texts]
+        return results[0] if single else results
+
+class TranslationMemo:
+    """Persistent source text -> translation memo stored in SQLite, shared across runs."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS memo (source TEXT, target TEXT, translation TEXT, PRIMARY KEY (source, target))'
+        )
+        self._conn.commit()
+
+    def get_many(self, texts, target_language):
+        """Return a dict of the memoized translations among `texts`."""
+        found = {}
+        texts = list(texts)
+        with self._lock:
+            for start in range(0, len(texts), 500):
+                chunk = texts[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT source, translation FROM memo WHERE target = ? AND source IN ({placeholders})',
+                    [target_language] + chunk
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def put_many(self, translations, target_language):
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO memo (source, target, translation) VALUES (?, ?, ?)',
+                [(source, target_language, translation) for source, translation in translations.items()]
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def cyrillic_mask(series):
+    """Vectorized check for text that is already in Russian (contains Cyrillic characters)."""
+    return series.astype('string').str.contains(CYRILLIC_PATTERN, regex=True).fillna(False).astype(bool)
+
+def make_batches(texts, max_segments=MAX_SEGMENTS_PER_REQUEST, max_chars=MAX_CHARS_PER_REQUEST):
+    """Split texts into request-sized batches by segment count and total length."""
+    batch = []
+    chars = 0
+    for text in texts:
+        if batch and (len(batch) >= max_segments or chars + len(text) > max_chars):
+            yield batch
+            batch = []
+            chars = 0
+        batch.append(text)
+        chars += len(text)
+    if batch:
+        yield batch
+
+def translate_names(translate_client, names, target_language='ru', memo=None, max_workers=4):
+    """Translate a collection of names with as few API requests as possible.
+
+    Names are deduplicated, names that are already Cyrillic are kept as they are,
+    memoized translations are reused and the rest is sent in concurrent batches.
+    Returns a dict mapping every non-empty input name to its translation.
+    """
+    unique = pd.Series(pd.unique(pd.Series(list(names), dtype='string').dropna()), dtype='string')
+    unique = unique[unique.str.strip() != '']
+    russian = cyrillic_mask(unique)
+    translations = {name: name for name in unique[russian]}
+
+    todo = list(unique[~russian])
+    if memo is not None and todo:
+        translations.update(memo.get_many(todo, target_language))
+        missing = [name for name in todo if name not in translations]
+        metrics.observe_cache('translate', hit=True, count=len(todo) - len(missing))
+        metrics.observe_cache('translate', hit=False, count=len(missing))
+        todo = missing
+    if not todo:
+        return translations
+
+    def translate_batch(batch):
+        start = time.perf_counter()
+        try:
+            results = translate_client.translate(batch, target_language=target_language)
+        except Exception:
+            metrics.observe_request('translate', 'error', time.perf_counter() - start)
+            raise
+        metrics.observe_request('translate', 200, time.perf_counter() - start)
+        return {source: html.unescape(result['translatedText']) for source, result in zip(batch, results)}
+
+    batches = list(make_batches(todo))
+    print(f"Translating {len(todo)} names in {len(batches)} requests...")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch_translations in executor.map(translate_batch, batches):
+            translations.update(batch_translations)
+            if memo is not None:
+                memo.put_many(batch_translations, target_language)
+    return translations
+
+def run_translation(input_file, output_file, google_credentials=None, translate_client=None, memo_file=None,
+                    target_language='ru', max_workers=4, memo=None):
+    """Run the translation process on the specified input file.
+
+    Every caption in both sections of the ImportGenius-style CSV is translated.
+    Pass `translate_client` (e.g. StubTranslateClient) to avoid the Google API,
+    and `memo_file` (or an open TranslationMemo `memo`) to reuse translations
+    across runs.
+    """
+
+    if translate_client is None:
+        translate_client = make_translate_client(google_credentials)
+    own_memo = memo is None and memo_file
+    if own_memo:
+        memo = TranslationMemo(memo_file)
 
     # Step 1: Load the CSV file
     print(f"Reading input file: {input_file}")
-    df = pd.read_csv(input_file)
-
-    # Step 2: Translate only the rows A3:A269 (index 2 to 268 in Python)
-    def translate_text(text, target_language='ru'):
-        """Translates text into the target language using Google Translate."""
-        result = translate_client.translate(text, target_language=target_language)
-        return html.unescape(result['translatedText'])  # Decode HTML entities
-
-    def is_russian(text):
-        """Detect if the text is already in Russian (Cyrillic characters)."""
-        return any('а' <= char <= 'я' or 'А' <= char <= 'Я' for char in text)
-
-    # Apply translation to rows 3 to 269 in the first column ('caption' or A)
-    for i in range(2, 269):  # Corresponds to A3 to A269 in the file
-        company_name = df.iloc[i, 0]  # Access column A (the first column in the CSV)
-        
-        # Translate if the text is not already in Russian
-        if not is_russian(company_name):
-            df.iloc[i, 0] = translate_text(company_name)
-
-    # Step 3: Save the translated CSV file
-    df.to_csv(output_file, index=False)
+    df = read_sections(input_file)
+
+    # Step 2: Translate every distinct caption that is not already in Russian
+    translations = translate_names(translate_client, df['caption'], target_language, memo, max_workers)
+    df['caption'] = df['caption'].map(translations).fillna(df['caption'])
+    metrics.count_rows('translate', rows_in=len(df), rows_out=len(df))
+
+    # Step 3: Save the translated CSV file, keeping the screening columns of a screened export
+    screening = [column for column in SCREENING_COLUMNS if df[column].notna().any()]
+    export_sections(df, output_file, extra_columns=screening)
     print(f"Translated file saved to: {output_file}")
+    if own_memo:
+        memo.close()